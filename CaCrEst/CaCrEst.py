@@ -1,127 +1,377 @@
+import argparse
+import copy
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-import tkinter as tk
-from tkinter import filedialog
-from math import exp
-from openpyxl import load_workbook
-from openpyxl.styles import Border, Side, PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.styles import Alignment
-import matplotlib.pyplot as plt
-
-def adjust_column_width(ws):
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter  # Nome colunas
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column].width = adjusted_width
-
-def add_borders(ws):
+from math import log
+
+# Colunas da planilha de saída, na ordem
+OUTPUT_COLUMNS = ['Circunferência', 'Diâmetro', 'Partes perenes acima e abaixo do solo mais folhas',
+                  'Biomassa C (kg)', 'CO2eq']
+
+# Modelos alométricos em escala log: valor = exp(a + b·log D). O modelo de cada árvore vem da coluna
+# "Modelo" da planilha, ou da espécie ("Espécie") ou da parcela ("Parcela") pelos mapas abaixo, ou do padrão.
+# float_diameter usa o diâmetro sem arredondar para inteiro.
+DEFAULT_ALLOMETRY = {
+    'models': {
+        'padrao': {'biomass': [-6.0032, 3.7578], 'co2eq': [log(0.004198), 3.779016], 'carbon_fraction': 0.5},
+    },
+    'species': {},
+    'plots': {},
+    'default': 'padrao',
+    'float_diameter': False,
+}
+MODEL_COLUMN, SPECIES_COLUMN, PLOT_COLUMN = 'Modelo', 'Espécie', 'Parcela'
+
+# Limites das classes de diâmetro do gráfico (a primeira classe inclui o limite inferior)
+DIAMETER_BINS = [19, 22, 25, 28, 31, 34, 37, 40]
+
+# Largura de cada coluna: maior texto da coluna (cabeçalho incluído) + 2, como o Excel mostra os valores
+def column_widths(df):
+    widths = []
+    for column in df.columns:
+        text = df[column].astype(str).str.removesuffix('.0')  # números inteiros aparecem sem casa decimal
+        widths.append(max(len(str(column)), text.str.len().max() if len(text) else 0) + 2)
+    return widths
+
+# Estilos nomeados compartilhados: todas as células com borda fina, cabeçalho e média em verde
+def _register_styles(wb):
+    from openpyxl.styles import Border, NamedStyle, PatternFill, Side
     thin = Side(border_style="thin", color="000000")
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.border = Border(top=thin, left=thin, right=thin, bottom=thin)
+    border = Border(top=thin, left=thin, right=thin, bottom=thin)
+    medium_green_fill = PatternFill(start_color="00C000", end_color="00C000", fill_type="solid")
+    wb.add_named_style(NamedStyle(name='CaCrEst', border=border))
+    wb.add_named_style(NamedStyle(name='CaCrEst destaque', border=border, fill=medium_green_fill))
+    return 'CaCrEst', 'CaCrEst destaque'
 
-def process_excel(file_path):
-    # Lê o arquivo Excel
-    df = pd.read_excel(file_path)
+# Grava a planilha de saída em uma única passagem (modo write-only): cabeçalho e última linha destacados
+def write_styled_excel(df, output_file):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    plain, highlight = _register_styles(wb)
+    for i, width in enumerate(column_widths(df), start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
 
-    # Coluna A 
-    df['Circunferência'] = df.iloc[:, 0] + 0
+    def styled(values, style):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=None if pd.isna(value) else value)
+            cell.style = style
+            cells.append(cell)
+        return cells
+
+    ws.append(styled(df.columns, highlight))
+    rows = list(zip(*(df[column].tolist() for column in df.columns)))
+    for i, row in enumerate(rows, start=1):
+        ws.append(styled(row, highlight if i == len(rows) else plain))
+    wb.save(output_file)
+
+# Lê um JSON com modelos e mapas de espécies/parcelas (mesmas chaves de DEFAULT_ALLOMETRY) sobre o padrão
+def load_allometry(config_file=None):
+    allometry = copy.deepcopy(DEFAULT_ALLOMETRY)
+    if config_file:
+        with open(config_file, encoding='utf-8') as f:
+            config = json.load(f)
+        for key in ('models', 'species', 'plots'):
+            allometry[key].update(config.get(key, {}))
+        for key in ('default', 'float_diameter'):
+            allometry[key] = config.get(key, allometry[key])
+    return allometry
+
+# Modelo de cada árvore da planilha (coluna Modelo > espécie > parcela > modelo padrão)
+def select_models(df, allometry=DEFAULT_ALLOMETRY):
+    models = pd.Series(allometry['default'], index=df.index, dtype=object)
+    for column, mapping in ((PLOT_COLUMN, allometry['plots']), (SPECIES_COLUMN, allometry['species'])):
+        if column in df and mapping:
+            mapped = df[column].map(mapping)
+            models = models.mask(mapped.notna(), mapped)
+    if MODEL_COLUMN in df:
+        models = models.mask(df[MODEL_COLUMN].notna(), df[MODEL_COLUMN])
+    unknown = set(models) - set(allometry['models'])
+    if unknown:
+        raise ValueError(f"Modelos alométricos desconhecidos: {', '.join(sorted(map(str, unknown)))}")
+    return models.to_numpy()
+
+# Calcula as colunas alométricas de uma vez sobre a coluna de circunferências (coluna A). Os coeficientes
+# de cada modelo são distribuídos às suas árvores, e todas são avaliadas juntas em escala log.
+def calculate_inventory(circumference, models=None, allometry=DEFAULT_ALLOMETRY):
+    circumference = np.asarray(circumference, dtype=np.float64)
+    # Circunferência vazia ou inválida não vira diâmetro: a linha 1 da planilha é o cabeçalho
+    invalid = np.flatnonzero(~np.isfinite(circumference))
+    if len(invalid):
+        rows = ', '.join(str(i + 2) for i in invalid[:10]) + (' ...' if len(invalid) > 10 else '')
+        raise ValueError(f"Circunferência vazia ou inválida em {len(invalid)} linha(s) da planilha: {rows}")
+    if models is None:
+        models = np.full(len(circumference), allometry['default'], dtype=object)
+    codes, names = pd.factorize(models)
+    coefficients = np.array([allometry['models'][name]['biomass'] + allometry['models'][name]['co2eq']
+                             + [allometry['models'][name].get('carbon_fraction', 0.5)] for name in names],
+                            dtype=np.float64).reshape(len(names), 5)[codes]
 
     # Coluna B
-    df['Diâmetro'] = (df['Circunferência'] / 3.1416).round().astype(int)
+    diameter = circumference / 3.1416
+    if not allometry['float_diameter']:
+        diameter = np.rint(diameter).astype(int)
+    with np.errstate(divide='ignore'):
+        log_diameter = np.log(diameter)
 
     # Coluna C
-    df['Partes perenes acima e abaixo do solo mais folhas'] = (exp(-6.0032) * df['Diâmetro']**3.7578).round(1)
+    biomass = np.round(np.exp(coefficients[:, 0] + coefficients[:, 1] * log_diameter), 1)
 
     # Coluna D
-    df['Biomassa C (kg)'] = (df['Partes perenes acima e abaixo do solo mais folhas'] / 2).round(1)
+    carbon = np.round(biomass * coefficients[:, 4], 1)
 
     # Coluna F
-    df['CO2eq'] = (0.004198 * df['Diâmetro']**3.779016).round(2)
+    co2eq = np.round(np.exp(coefficients[:, 2] + coefficients[:, 3] * log_diameter), 2)
 
-    # Linhas de média
-    mean_row = {
-        'Circunferência': 'Média',
-        'Diâmetro': df['Diâmetro'].mean().round(),
-        'Partes perenes acima e abaixo do solo mais folhas': df['Partes perenes acima e abaixo do solo mais folhas'].mean().round(1),
-        'Biomassa C (kg)': df['Biomassa C (kg)'].mean().round(1),
-        'CO2eq': df['CO2eq'].mean().round(2)
+    if allometry['float_diameter']:
+        diameter = np.round(diameter, 2)
+    return pd.DataFrame(dict(zip(OUTPUT_COLUMNS, [circumference + 0, diameter, biomass, carbon, co2eq])))
+
+# Acrescenta a linha de média ao final da tabela calculada
+def add_mean_row(df):
+    means = df[OUTPUT_COLUMNS[1:]].to_numpy(dtype=np.float64).mean(axis=0)
+    diameter_decimals = 0 if df['Diâmetro'].dtype.kind in 'iu' else 2
+    mean_row = dict(zip(OUTPUT_COLUMNS, ['Média', np.round(means[0], diameter_decimals), np.round(means[1], 1),
+                                         np.round(means[2], 1), np.round(means[3], 2)]))
+    return pd.concat([df, pd.DataFrame([mean_row])], ignore_index=True)
+
+# Totais de uma planilha calculada (sem a linha de média), para a tabela-resumo do modo em lote
+def summarize_inventory(df, file_path, output_file):
+    return {
+        'Arquivo': os.path.basename(file_path),
+        'Nº de Plantas': len(df),
+        'Diâmetro médio': round(df['Diâmetro'].mean(), 1) if len(df) else np.nan,
+        'Biomassa total (kg)': round(df['Partes perenes acima e abaixo do solo mais folhas'].sum(), 1),
+        'Biomassa C total (kg)': round(df['Biomassa C (kg)'].sum(), 1),
+        'CO2eq total': round(df['CO2eq'].sum(), 2),
+        'Saída': output_file,
     }
 
-    mean_df = pd.DataFrame([mean_row])
-    df = pd.concat([df, mean_df], ignore_index=True)
+# Conta as árvores por classe de diâmetro em uma passagem; classes fechadas à direita, como (22, 25].
+# Árvores fora dos limites ganham as classes "abaixo de" e "acima de" quando existirem.
+def diameter_histogram(diameter, bins=DIAMETER_BINS):
+    diameter = np.asarray(diameter, dtype=np.float64)
+    diameter = diameter[~np.isnan(diameter)]
+    bins = np.asarray(bins, dtype=np.float64)
+    index = np.digitize(diameter, bins, right=True)
+    index[diameter == bins[0]] = 1
+    counts = np.bincount(index, minlength=len(bins) + 1)
+    labels = [f'{a:g} a {b:g}' for a, b in zip(bins[:-1], bins[1:])]
+    classes = list(zip(labels, counts[1:-1].tolist()))
+    if counts[0]:
+        classes.insert(0, (f'abaixo de {bins[0]:g}', int(counts[0])))
+    if counts[-1]:
+        classes.append((f'acima de {bins[-1]:g}', int(counts[-1])))
+    return [label for label, _ in classes], [count for _, count in classes]
 
-    # Seleciona apenas as colunas desejadas para o arquivo de saída
-    df_output = df[['Circunferência', 'Diâmetro', 'Partes perenes acima e abaixo do solo mais folhas', 'Biomassa C (kg)', 'CO2eq']]
+# Desenha o gráfico em uma figura própria (Agg, sem o estado global do pyplot), segura em processos paralelos
+def render_histogram(labels, counts, graph_file):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
 
-    # Salva o arquivo Excel 
-    output_file = file_path.replace('.xlsx', '_Calculado.xlsx')
-    df_output.to_excel(output_file, index=False)
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.bar(labels, counts)
+    ax.set_xlabel('Classes de Diâmetro')
+    ax.set_ylabel('Nº de Plantas')
+    ax.set_title('Distribuição do Diâmetro das Plantas')
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    fig.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.3)  # Ajusta margens
+    fig.savefig(graph_file)  # Salva o gráfico como uma imagem
+    return graph_file
 
-    # Largura das células e adiciona bordas
-    wb = load_workbook(output_file)
-    ws = wb.active
-    adjust_column_width(ws)
-    add_borders(ws)
+# Nomes padrão da planilha calculada e do gráfico: o nome da entrada sem a extensão (.xlsx ou .xls)
+def default_outputs(file_path, output_dir=None):
+    base = os.path.splitext(file_path)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return base + '_Calculado.xlsx', base + '_Graph.png'
 
-    # Cor do cabeçalho (linha 1) e linha de média (última linha)
-    medium_green_fill = PatternFill(start_color="00C000", end_color="00C000", fill_type="solid")
-    header_row = ws[1]
-    mean_row = ws[ws.max_row]
-    for cell in header_row:
-        cell.fill = medium_green_fill
-    for cell in mean_row:
-        cell.fill = medium_green_fill
+# Nunca grava uma saída por cima da planilha de entrada
+def check_output(file_path, output_file):
+    if os.path.abspath(output_file) == os.path.abspath(file_path):
+        raise ValueError(f"O arquivo de saída é o próprio arquivo de entrada: {output_file}")
+    return output_file
 
-    wb.save(output_file)
+# Calcula e grava a planilha de saída; retorna as árvores calculadas (sem a média) e o arquivo gravado
+def _process(file_path, output_file=None, allometry=DEFAULT_ALLOMETRY):
+    output_file = check_output(file_path, output_file or default_outputs(file_path)[0])
 
-    # Gera gráfico
-    num_plants = len(df) - 1  # Exclui linha de média
-    diameter_classes = ['19 a 22', '22 a 25', '25 a 28', '28 a 31', '31 a 34', '34 a 37', '37 a 40']
-    diameter_counts = [((df['Diâmetro'] >= 19) & (df['Diâmetro'] <= 22)).sum(),
-                       ((df['Diâmetro'] > 22) & (df['Diâmetro'] <= 25)).sum(),
-                       ((df['Diâmetro'] > 25) & (df['Diâmetro'] <= 28)).sum(),
-                       ((df['Diâmetro'] > 28) & (df['Diâmetro'] <= 31)).sum(),
-                       ((df['Diâmetro'] > 31) & (df['Diâmetro'] <= 34)).sum(),
-                       ((df['Diâmetro'] > 34) & (df['Diâmetro'] <= 37)).sum(),
-                       ((df['Diâmetro'] > 37) & (df['Diâmetro'] <= 40)).sum()]
-
-    plt.bar(diameter_classes, diameter_counts)
-    plt.xlabel('Classes de Diâmetro')
-    plt.ylabel('Nº de Plantas')
-    plt.title('Distribuição do Diâmetro das Plantas')
-    plt.xticks(rotation=45, ha='right')
-    plt.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.3)  # Ajusta margens
-    plt.savefig(file_path.replace('.xlsx', '_Graph.png'))  # Salva o gráfico como uma imagem
-    plt.close()  # Fecha a figura após salvar
-
-    # Mensagem de sucesso
-    success_label.config(text=f"Arquivo processado salvo como {output_file}")
+    # Lê o arquivo Excel
+    df = pd.read_excel(file_path)
+
+    # Coluna A e colunas calculadas
+    trees = calculate_inventory(df.iloc[:, 0], select_models(df, allometry), allometry)
+
+    # Linhas de média
+    df_output = add_mean_row(trees)
+
+    # Salva o arquivo Excel, já com larguras, bordas e destaques
+    write_styled_excel(df_output, output_file)
+    return trees, output_file
+
+# Processa uma planilha; chart=False não gera o gráfico
+def process_excel(file_path, output_file=None, graph_file=None, bins=DIAMETER_BINS, chart=True,
+                  allometry=DEFAULT_ALLOMETRY):
+    trees, output_file = _process(file_path, output_file, allometry)
+
+    # Gera gráfico (sem a linha de média)
+    if chart:
+        labels, counts = diameter_histogram(trees['Diâmetro'], bins)
+        render_histogram(labels, counts, check_output(file_path, graph_file or default_outputs(file_path)[1]))
+
+    return output_file
+
+# Lista as planilhas de inventário de pastas, padrões glob ou arquivos (ignora as saídas já calculadas)
+def find_inventories(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, '*.xlsx')) + glob.glob(os.path.join(path, '*.xls'))
+        else:
+            matches = glob.glob(path) or [path]
+        files.extend(sorted(f for f in matches if not f.endswith('_Calculado.xlsx')
+                            and not os.path.basename(f).startswith('~$')))
+    return list(dict.fromkeys(files))
+
+# Retorna a linha do resumo e, se o gráfico ficar para outro processo, os dados para desenhá-lo
+def _process_batch_file(args):
+    file_path, output_dir, bins, charts, allometry = args
+    output_file, graph_file = default_outputs(file_path, output_dir)
+    try:
+        check_output(file_path, graph_file)
+        trees, output_file = _process(file_path, output_file, allometry)
+        row = summarize_inventory(trees, file_path, output_file)
+        if not charts:
+            return row, None
+        labels, counts = diameter_histogram(trees['Diâmetro'], bins)
+        if charts == 'separate':
+            return row, (labels, counts, graph_file)
+        render_histogram(labels, counts, graph_file)
+        return row, None
+    except Exception as error:
+        return {'Arquivo': os.path.basename(file_path), 'Erro': str(error)}, None
+
+def _render_task(args):
+    return render_histogram(*args)
+
+# Processa várias planilhas em paralelo e retorna a tabela-resumo (uma linha por arquivo).
+# charts: 'inline' desenha os gráficos nos próprios processos, 'separate' em um processo só para eles
+# (os cálculos não esperam pelos gráficos) e None não gera gráficos.
+def process_batch(paths, output_dir=None, summary_file=None, workers=None, bins=DIAMETER_BINS, charts='inline',
+                  allometry=DEFAULT_ALLOMETRY):
+    files = find_inventories(paths)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    tasks = [(file_path, output_dir, bins, charts, allometry) for file_path in files]
+    chart_executor = ProcessPoolExecutor(max_workers=1) if charts == 'separate' and tasks else None
+    executor = None if workers == 1 or len(tasks) <= 1 else ProcessPoolExecutor(max_workers=workers)
+    rows, renders = [], []
+    try:
+        results = executor.map(_process_batch_file, tasks) if executor else map(_process_batch_file, tasks)
+        for row, chart_job in results:
+            rows.append(row)
+            if chart_job:
+                renders.append((row, chart_executor.submit(_render_task, chart_job)))
+        for row, future in renders:
+            try:
+                future.result()
+            except Exception as error:
+                row['Erro'] = f"Gráfico: {error}"
+    finally:
+        if executor:
+            executor.shutdown()
+        if chart_executor:
+            chart_executor.shutdown()
+
+    summary = pd.DataFrame(rows)
+    if 'Erro' in summary:
+        # Arquivos que falharam ficam na tabela, com a mensagem de erro na última coluna
+        summary = summary[[c for c in summary.columns if c != 'Erro'] + ['Erro']]
+    if summary_file:
+        if summary_file.lower().endswith('.csv'):
+            summary.to_csv(summary_file, index=False)
+        else:
+            summary.to_excel(summary_file, index=False)
+    return summary
 
 def select_file():
+    from tkinter import filedialog
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx *.xls")])
     if file_path:
-        process_excel(file_path)
+        output_file = process_excel(file_path)
+        # Mensagem de sucesso
+        success_label.config(text=f"Arquivo processado salvo como {output_file}")
+
+# Interface gráfica (tkinter é importado apenas aqui)
+def start_gui():
+    global success_label
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.title("CaCrEst")
+
+    frame = tk.Frame(root, padx=20, pady=20)
+    frame.pack(padx=20, pady=20)
+
+    select_button = tk.Button(frame, text="Selecionar Arquivo Excel", command=select_file)
+    select_button.pack()
+
+    success_label = tk.Label(frame, text="")
+    success_label.pack()
 
-# Interface gráfica
-root = tk.Tk()
-root.title("CaCrEst")
+    root.geometry("580x200")  # Tamanho do painel
+    root.mainloop()
 
-frame = tk.Frame(root, padx=20, pady=20)
-frame.pack(padx=20, pady=20)
+# Linha de comando: sem arquivos abre a interface gráfica; pastas, padrões ou vários arquivos usam o modo em lote
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CaCrEst: biomassa e CO2eq a partir de planilhas de inventário.")
+    parser.add_argument('arquivo', nargs='*', help="Planilha de inventário (.xlsx), pasta ou padrão glob")
+    parser.add_argument('-o', '--saida', help="Planilha de saída (padrão: <arquivo>_Calculado.xlsx)")
+    parser.add_argument('-g', '--grafico', help="Imagem do gráfico (padrão: <arquivo>_Graph.png)")
+    parser.add_argument('-d', '--pasta-saida', help="Modo em lote: pasta das planilhas e gráficos gerados")
+    parser.add_argument('-r', '--resumo', help="Modo em lote: tabela-resumo (.xlsx ou .csv)")
+    parser.add_argument('-j', '--processos', type=int, help="Modo em lote: número de processos (padrão: todos os núcleos)")
+    parser.add_argument('-c', '--classes', type=lambda text: [float(x) for x in text.split(',')],
+                        default=DIAMETER_BINS, help="Limites das classes de diâmetro do gráfico, separados por vírgula "
+                                                    "(padrão: 19,22,25,28,31,34,37,40)")
+    parser.add_argument('--sem-grafico', action='store_true', help="Não gera os gráficos")
+    parser.add_argument('--grafico-separado', action='store_true',
+                        help="Modo em lote: desenha os gráficos em um processo separado dos cálculos")
+    parser.add_argument('-m', '--modelo', help="Modelo alométrico padrão (padrão: padrao)")
+    parser.add_argument('--modelos', help="JSON com modelos alométricos e mapas de espécies/parcelas para modelos")
+    parser.add_argument('--diametro-decimal', action='store_true',
+                        help="Usa o diâmetro sem arredondar para inteiro nos cálculos")
+    args = parser.parse_args(argv)
 
-select_button = tk.Button(frame, text="Selecionar Arquivo Excel", command=select_file)
-select_button.pack()
+    allometry = load_allometry(args.modelos)
+    if args.modelo:
+        allometry['default'] = args.modelo
+    if args.diametro_decimal:
+        allometry['float_diameter'] = True
 
-success_label = tk.Label(frame, text="")
-success_label.pack()
+    if not args.arquivo:
+        start_gui()
+    elif len(args.arquivo) == 1 and os.path.isfile(args.arquivo[0]):
+        output_file = process_excel(args.arquivo[0], args.saida, args.grafico, args.classes, not args.sem_grafico,
+                                    allometry)
+        print(f"Arquivo processado salvo como {output_file}")
+    else:
+        charts = None if args.sem_grafico else 'separate' if args.grafico_separado else 'inline'
+        summary = process_batch(args.arquivo, args.pasta_saida, args.resumo, args.processos, args.classes, charts,
+                                allometry)
+        print(summary.to_string(index=False))
 
-root.geometry("580x200")  # Tamanho do painel
-root.mainloop()
+if __name__ == '__main__':
+    main()
@@ -1,62 +1,787 @@
-import tkinter as tk
-from tkinter import filedialog
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import pandas as pd
 import numpy as np
 
-def isanumber(a):
-    try:
-        float(a)
-        return True
-    except (ValueError, TypeError):
-        return False
+try:
+    import fcntl  # trava entre processos (não existe no Windows)
+except ImportError:
+    fcntl = None
+
+# Limite de elementos da matriz intermediária (consultas x banco x locos) por bloco
+LIMITE_ELEMENTOS_BLOCO = 1 << 22
+
+# Função para converter um DataFrame (nome + alelos) em nomes, matriz de alelos e máscara de validade.
+# Alelos vazios ou texto não entram no cálculo. No banco, 0 também é ausente (não há como dividir por ele);
+# nas consultas (zero_ausente=False), 0 é um loco válido com similaridade 0, como sempre foi
+def preparar_matriz(df, zero_ausente=True):
+    nomes = df.iloc[:, 0].to_numpy()
+    valores = df.iloc[:, 1:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    validos = np.isfinite(valores)
+    if zero_ausente:
+        validos &= valores != 0
+    return nomes, valores, validos
+
+# Função para calcular a matriz de similaridade genética (consultas x banco de dados)
+def matriz_similaridade(query, query_validos, reference, reference_validos):
+    # Compara apenas os locos presentes nos dois arquivos
+    n_locos = min(query.shape[1], reference.shape[1])
+    query, query_validos = query[:, :n_locos], query_validos[:, :n_locos]
+    reference, reference_validos = reference[:, :n_locos], reference_validos[:, :n_locos]
+
+    # Com q = 0 ou 1/r = 0 nos locos inválidos, max(0, 1 - |q/r - 1|) vale 0 e não soma nada
+    q = np.where(query_validos, query, 0.0)
+    inverso_r = np.zeros(reference.shape)
+    np.divide(1.0, reference, out=inverso_r, where=reference_validos, dtype=np.float64)
+
+    # Número de locos válidos em cada par (consulta, referência)
+    contagem = query_validos.astype(np.float64) @ reference_validos.T.astype(np.float64)
+
+    soma = np.empty((q.shape[0], inverso_r.shape[0]))
+    passo = max(1, LIMITE_ELEMENTOS_BLOCO // max(1, inverso_r.size))
+    for inicio in range(0, q.shape[0], passo):
+        bloco = q[inicio:inicio + passo, None, :] * inverso_r[None, :, :]
+        bloco -= 1.0
+        np.abs(bloco, out=bloco)
+        np.subtract(1.0, bloco, out=bloco)
+        np.maximum(bloco, 0.0, out=bloco)
+        bloco.sum(axis=2, out=soma[inicio:inicio + passo])
+
+    similaridade = np.zeros_like(soma)
+    np.divide(soma, contagem, out=similaridade, where=contagem > 0)
+    return similaridade
 
 # Função para calcular a similaridade genética entre duas linhas do DataFrame
 def calcular_similaridade(query, reference):
-    total_similarity = 0
-    valid_loci_count = 0
+    _, q, q_validos = preparar_matriz(pd.DataFrame([[None, *query]]), zero_ausente=False)
+    _, r, r_validos = preparar_matriz(pd.DataFrame([[None, *reference]]))
+    return float(matriz_similaridade(q, q_validos, r, r_validos)[0, 0])
+
+# Número de resultados por consulta no modo em lote
+RESULTADOS_POR_CONSULTA = 3
+
+# Função para selecionar os k maiores valores de cada linha (seleção parcial, sem ordenar a linha inteira)
+def selecionar_melhores(similaridade, k):
+    k = min(k, similaridade.shape[1])
+    if k < similaridade.shape[1]:
+        indices = np.argpartition(-similaridade, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(similaridade.shape[1]), (similaridade.shape[0], 1))
+    valores = np.take_along_axis(similaridade, indices, axis=1)
+    ordem = np.argsort(-valores, axis=1, kind='stable')
+    return np.take_along_axis(indices, ordem, axis=1), np.take_along_axis(valores, ordem, axis=1)
+
+# Índice de pré-filtragem: as referências são divididas sucessivamente em dois grupos (2-médias sobre todos
+# os locos) até cada grupo caber em um bloco, para que as linhas de um bloco sejam próximas em todos os locos.
+# Cada bloco guarda o menor e o maior alelo de cada loco e o menor número de locos válidos
+TAMANHO_BLOCO_INDICE = 64
+VERSAO_INDICE = 2
+ITERACOES_DIVISAO = 6
+
+# Função para dividir linhas em dois grupos por 2-médias. `valores` tem 0 nos alelos ausentes e `mascara` marca
+# os válidos; a distância é a média do quadrado das diferenças nos locos válidos da linha, para que um alelo
+# ausente não afaste a linha do seu grupo. Devolve o lado de cada linha e a fração da dispersão que resta
+def _dividir_em_dois(valores, mascara):
+    quadrados = np.einsum('ij,ij->i', valores, valores)[:, None]
+    contagem = np.maximum(mascara.sum(axis=1), 1)[:, None]
+
+    # Distância de cada linha a cada centro (uma coluna por centro)
+    def distancias(centros):
+        return (quadrados - 2 * (valores @ centros.T) + mascara @ (centros * centros).T) / contagem
+
+    # Centros dos grupos dados pelos pesos (uma linha de pesos por grupo)
+    def centros(pesos):
+        n = pesos @ mascara
+        return np.divide(pesos @ valores, n, out=np.zeros_like(n), where=n > 0)
+
+    metade = np.arange(len(valores)) >= len(valores) // 2
+    centro = centros(np.ones((1, len(valores)), dtype=valores.dtype))
+    dispersao = distancias(centro)[:, 0]
+    total = dispersao.sum()
+    if total <= 0:
+        return metade, 1.0
+    # Sementes: a linha mais distante do centro e a mais distante dela (com o centro nos alelos ausentes)
+    def semente(i):
+        return np.where(mascara[i] > 0, valores[i], centro[0])
+
+    a = semente(np.argmax(dispersao))
+    b = semente(np.argmax(distancias(a[None])[:, 0]))
+    lado = np.diff(distancias(np.stack([a, b])), axis=1)[:, 0] < 0
+    for _ in range(ITERACOES_DIVISAO + 1):
+        if lado.all() or not lado.any():
+            return metade, 1.0
+        d = distancias(centros(np.stack([~lado, lado]).astype(valores.dtype)))
+        novo_lado = d[:, 1] < d[:, 0]
+        if (novo_lado == lado).all():
+            break
+        lado = novo_lado
+    if lado.all() or not lado.any():
+        return metade, 1.0
+    restante = np.where(lado, d[:, 1], d[:, 0]).sum()
+    return lado, max(0.0, restante / total)
+
+# Função para agrupar as linhas em grupos de até `tamanho` linhas próximas entre si. Um grupo que já cabe em
+# um bloco ainda é dividido se juntar linhas bem separadas: a divisão elimina mais da metade da dispersão e
+# nenhum dos lados fica com uma linha só (uma linha sempre "elimina" toda a dispersão de um par)
+def _agrupar_linhas(valores, mascara, tamanho):
+    grupos = []
+    pendentes = [np.arange(len(valores))]
+    while pendentes:
+        linhas = pendentes.pop()
+        if len(linhas) > 1:
+            lado, restante = _dividir_em_dois(valores[linhas], mascara[linhas])
+            separados = restante < 0.5 and 2 <= lado.sum() <= len(linhas) - 2
+            if len(linhas) > tamanho or separados:
+                pendentes += [linhas[~lado], linhas[lado]]
+                continue
+        if len(linhas):
+            grupos.append(linhas)
+    return grupos
+
+# Função para construir o índice de blocos sobre a matriz de alelos do banco
+def construir_indice(alelos, validos, tamanho_bloco=TAMANHO_BLOCO_INDICE):
+    n_linhas, n_locos = alelos.shape
+    alelos = np.asarray(alelos, dtype=np.float32)
+    grupos = _agrupar_linhas(np.where(validos, alelos, np.float32(0.0)), validos.astype(np.float32), tamanho_bloco)
+
+    # Cada grupo ocupa um bloco, completado com -1
+    tamanhos = np.array([len(grupo) for grupo in grupos], dtype=np.int64)
+    ordem = np.full(len(grupos) * tamanho_bloco, -1, dtype=np.int64)
+    if len(grupos):
+        inicio = np.arange(len(grupos)) * tamanho_bloco - np.cumsum(tamanhos) + tamanhos
+        ordem[np.repeat(inicio, tamanhos) + np.arange(n_linhas)] = np.concatenate(grupos)
+    ocupada = ordem >= 0
+    alelos_ordem = alelos[np.maximum(ordem, 0)].reshape(len(grupos), tamanho_bloco, n_locos)
+    validos_ordem = (validos[np.maximum(ordem, 0)] & ocupada[:, None]).reshape(alelos_ordem.shape)
+
+    contagem = validos_ordem.sum(axis=2)
+    # Posições vazias dos blocos não podem reduzir o mínimo de locos válidos
+    contagem[~ocupada.reshape(contagem.shape)] = n_locos
+    return {
+        'ordem': ordem,
+        'minimo': np.where(validos_ordem, alelos_ordem, np.inf).min(axis=1).astype(np.float32),
+        'maximo': np.where(validos_ordem, alelos_ordem, -np.inf).max(axis=1).astype(np.float32),
+        'validos_min': contagem.min(axis=1).astype(np.int32),
+        'tamanho_bloco': np.int64(tamanho_bloco),
+    }
+
+# Função para calcular, para cada consulta, o limite superior da similaridade de qualquer linha de cada bloco
+def limites_superiores(query, query_validos, indice):
+    minimo, maximo = indice['minimo'], indice['maximo']
+    n_locos_banco = minimo.shape[1]
+    n_locos = min(query.shape[1], n_locos_banco)
+    query, query_validos = query[:, :n_locos], query_validos[:, :n_locos]
+    minimo, maximo = minimo[:, :n_locos], maximo[:, :n_locos]
+
+    # Dentro de [mínimo, máximo], max(0, 1 - |q-r|/r) é maior no alelo mais próximo de q
+    q = np.where(query_validos, query, 0.0)[:, None, :]
+    r = np.clip(q, minimo[None], maximo[None])
+    elegivel = query_validos[:, None, :] & (minimo <= maximo)[None]
+    limite = np.abs(q - r)
+    np.divide(limite, r, out=limite, where=elegivel)
+    np.subtract(1.0, limite, out=limite)
+    np.maximum(limite, 0.0, out=limite)
+    limite[~elegivel] = 0.0
+
+    # Cada linha do bloco compartilha com a consulta pelo menos m locos válidos; a média de quaisquer
+    # m limites não passa da média dos m maiores (os últimos, em ordem crescente)
+    m = indice['validos_min'][None, :] - n_locos_banco + query_validos.sum(axis=1)[:, None]
+    m = np.clip(m, 1, n_locos)
+    limite.sort(axis=2)
+    acumulado = np.cumsum(limite[:, :, ::-1], axis=2)
+    return np.take_along_axis(acumulado, (m - 1)[:, :, None], axis=2)[:, :, 0] / m
+
+# Fração dos blocos acima da qual a pré-filtragem desiste: visitar quase todos os blocos, um a um, custa mais
+# que a busca completa
+FRACAO_MAX_BLOCOS = 0.5
+
+# Função para obter as k referências mais similares de uma consulta visitando só os blocos promissores. Devolve
+# None quando, depois da primeira rodada, mais de FRACAO_MAX_BLOCOS dos blocos ainda podem entrar no resultado
+def _melhores_com_indice(query, query_validos, reference, reference_validos, indice, limites, k, limiar):
+    ordem, tamanho_bloco = indice['ordem'], int(indice['tamanho_bloco'])
+    blocos = np.flatnonzero(limites >= limiar)
+    blocos = blocos[np.argsort(-limites[blocos], kind='stable')]
+    blocos_por_rodada = max(1, 2048 // tamanho_bloco)
+
+    indices = np.empty(0, dtype=np.int64)
+    valores = np.empty(0)
+    corte = limiar
+    for inicio in range(0, len(blocos), blocos_por_rodada):
+        rodada = blocos[inicio:inicio + blocos_por_rodada]
+        rodada = rodada[limites[rodada] >= corte]
+        if len(rodada) == 0:
+            break
+        linhas = ordem[(rodada[:, None] * tamanho_bloco + np.arange(tamanho_bloco)).ravel()]
+        linhas = linhas[linhas >= 0]
+        similaridade = matriz_similaridade(query, query_validos, reference[linhas], reference_validos[linhas])[0]
+        indices = np.concatenate([indices, linhas])
+        valores = np.concatenate([valores, similaridade])
+        melhores, valores = selecionar_melhores(valores[None, :], k)
+        indices, valores = indices[melhores[0]], valores[0]
+        if len(valores) == k:
+            corte = max(limiar, valores[-1])
+        if inicio == 0 and (limites >= corte).sum() > FRACAO_MAX_BLOCOS * len(limites):
+            return None
+    manter = valores >= limiar
+    return indices[manter], valores[manter]
+
+# Função para obter as k referências mais similares de cada consulta, em blocos de consultas. Resultados
+# abaixo de `limiar` são descartados (índice -1); com `indice`, blocos que não alcançam o limiar ou o
+# k-ésimo melhor resultado não são pontuados, e o resultado continua exato. Consultas para as quais o índice
+# não descarta blocos suficientes vão para a busca completa
+def melhores_por_consulta(query, query_validos, reference, reference_validos, k=RESULTADOS_POR_CONSULTA,
+                          limiar=0.0, indice=None):
+    k = min(k, reference.shape[0])
+    indices = np.full((query.shape[0], k), -1, dtype=np.int64)
+    valores = np.full((query.shape[0], k), np.nan)
+
+    if indice is not None:
+        completas = []
+        passo = max(1, LIMITE_ELEMENTOS_BLOCO // max(1, indice['minimo'].size))
+        for inicio in range(0, query.shape[0], passo):
+            # Se o índice não serviu para a maioria das consultas já vistas, as demais vão direto para a busca
+            # completa, sem calcular os limites
+            if 2 * len(completas) > inicio > 0:
+                completas += range(inicio, query.shape[0])
+                break
+            fim = inicio + passo
+            limites = limites_superiores(query[inicio:fim], query_validos[inicio:fim], indice)
+            for i in range(inicio, min(fim, query.shape[0])):
+                resultado = _melhores_com_indice(query[i:i + 1], query_validos[i:i + 1], reference,
+                                                 reference_validos, indice, limites[i - inicio], k, limiar)
+                if resultado is None:
+                    completas.append(i)
+                    continue
+                melhores, similaridade = resultado
+                indices[i, :len(melhores)] = melhores
+                valores[i, :len(melhores)] = similaridade
+        if completas:
+            indices[completas], valores[completas] = melhores_por_consulta(
+                query[completas], query_validos[completas], reference, reference_validos, k, limiar)
+        return indices, valores
 
-    for q, r in zip(query, reference):
-        if isanumber(q) and isanumber(r) and not (np.isnan(float(q)) or np.isnan(float(r))):
-            q = float(q)
-            r = float(r)
-            loco_similarity = max(0, 1 - abs(q - r) / r)
-            total_similarity += loco_similarity
-            valid_loci_count += 1
+    passo = max(1, LIMITE_ELEMENTOS_BLOCO // max(1, reference.shape[0]))
+    for inicio in range(0, query.shape[0], passo):
+        fim = inicio + passo
+        similaridade = matriz_similaridade(query[inicio:fim], query_validos[inicio:fim], reference, reference_validos)
+        indices[inicio:fim], valores[inicio:fim] = selecionar_melhores(similaridade, k)
+    abaixo = valores < limiar
+    indices[abaixo], valores[abaixo] = -1, np.nan
+    return indices, valores
 
-    if valid_loci_count == 0:
-        return 0
+# Execução paralela: o banco é dividido em blocos de linhas pontuados por um pool de processos. Os
+# processos não recebem cópias do banco: a matriz de alelos vem do próprio arquivo mmap do banco
+# compilado e os demais arrays são colocados em memória compartilhada
+LINHAS_POR_BLOCO = 8192
+
+def _descrever_array(array, recursos):
+    if (isinstance(array, np.memmap) and array.filename and array.flags.c_contiguous
+            and os.path.getsize(array.filename) == array.offset + array.nbytes):
+        return ('mmap', array.filename, array.offset, array.shape, array.dtype.str)
+    memoria = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    recursos.append(memoria)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memoria.buf)[...] = array
+    return ('shm', memoria.name, 0, array.shape, array.dtype.str)
+
+def _abrir_array(descritor, recursos):
+    tipo, nome, deslocamento, forma, dtype = descritor
+    if tipo == 'mmap':
+        return np.memmap(nome, dtype=dtype, mode='r', offset=deslocamento, shape=forma)
+    memoria = shared_memory.SharedMemory(name=nome)
+    recursos.append(memoria)
+    return np.ndarray(forma, dtype=dtype, buffer=memoria.buf)
+
+_trabalho = {}
+
+def _iniciar_processo(descritor_alelos, descritor_validos, query, query_validos, k, limiar):
+    recursos = []
+    _trabalho.update(alelos=_abrir_array(descritor_alelos, recursos),
+                     validos=_abrir_array(descritor_validos, recursos),
+                     query=query, query_validos=query_validos, k=k, limiar=limiar, recursos=recursos)
+
+def _pontuar_bloco(intervalo):
+    inicio, fim = intervalo
+    indices, valores = melhores_por_consulta(_trabalho['query'], _trabalho['query_validos'],
+                                             _trabalho['alelos'][inicio:fim], _trabalho['validos'][inicio:fim],
+                                             _trabalho['k'], _trabalho['limiar'])
+    indices[indices >= 0] += inicio
+    return indices, valores
+
+# Função para obter as k referências mais similares de cada consulta com vários processos; os k melhores
+# de cada bloco são combinados no final
+def melhores_em_paralelo(query, query_validos, reference, reference_validos, k=RESULTADOS_POR_CONSULTA,
+                         limiar=0.0, processos=None, linhas_por_bloco=LINHAS_POR_BLOCO):
+    k = min(k, reference.shape[0])
+    intervalos = [(inicio, min(inicio + linhas_por_bloco, reference.shape[0]))
+                  for inicio in range(0, reference.shape[0], linhas_por_bloco)]
+    if len(intervalos) <= 1 or processos == 1:
+        return melhores_por_consulta(query, query_validos, reference, reference_validos, k, limiar)
+
+    recursos = []
+    try:
+        argumentos = (_descrever_array(reference, recursos), _descrever_array(reference_validos, recursos),
+                      query, query_validos, k, limiar)
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo,
+                                 initargs=argumentos) as executor:
+            partes = list(executor.map(_pontuar_bloco, intervalos))
+    finally:
+        for memoria in recursos:
+            memoria.close()
+            memoria.unlink()
+
+    indices = np.concatenate([parte[0] for parte in partes], axis=1)
+    valores = np.concatenate([parte[1] for parte in partes], axis=1)
+    melhores, valores = selecionar_melhores(np.where(indices >= 0, valores, -np.inf), k)
+    indices = np.take_along_axis(indices, melhores, axis=1)
+    ausentes = np.isinf(valores)
+    indices[ausentes], valores[ausentes] = -1, np.nan
+    return indices, valores
+
+# Função para comparar todas as consultas de uma planilha com o banco e montar a tabela de resultados.
+# O prefiltro (`indice`) roda em um único processo e não pode ser combinado com `processos`
+def comparar_lote(query_df, nomes_banco, banco, banco_validos, k=RESULTADOS_POR_CONSULTA, limiar=0.0, indice=None,
+                  processos=1, linhas_por_bloco=LINHAS_POR_BLOCO):
+    if indice is not None and processos != 1:
+        raise ValueError("O prefiltro roda em um único processo: use processos=1 com o índice")
+    nomes_query, query, query_validos = preparar_matriz(query_df, zero_ausente=False)
+
+    # Linhas sem alelos válidos (cabeçalhos) não são consultas
+    linhas = query_validos.any(axis=1)
+    nomes_query, query, query_validos = nomes_query[linhas], query[linhas], query_validos[linhas]
+
+    if processos != 1:
+        indices, valores = melhores_em_paralelo(query, query_validos, banco, banco_validos, k, limiar, processos,
+                                                linhas_por_bloco)
+    else:
+        indices, valores = melhores_por_consulta(query, query_validos, banco, banco_validos, k, limiar, indice)
+    encontrados = (indices >= 0).ravel()
+    return pd.DataFrame({
+        'Query': np.repeat(nomes_query, indices.shape[1])[encontrados],
+        'Rank': np.tile(np.arange(1, indices.shape[1] + 1), indices.shape[0])[encontrados],
+        'Reference': np.asarray(nomes_banco, dtype=object)[indices.ravel()[encontrados]],
+        'Similarity': valores.ravel()[encontrados],
+    })
+
+# Função para exportar a tabela de resultados (.csv ou .xlsx, conforme a extensão)
+def exportar_resultados(tabela, caminho):
+    if caminho.lower().endswith(('.xlsx', '.xls')):
+        tabela.to_excel(caminho, index=False)
+    else:
+        tabela.to_csv(caminho, index=False)
+
+# Banco de dados compilado: diretório "<planilha>.certibase" ao lado do .xlsx. Cada compilação ou compactação
+# grava uma geração nova (geracoes/000001, ...) e só então troca o ponteiro atual.json, de uma vez; uma
+# interrupção deixa sempre a geração anterior inteira. Acessos adicionados depois ficam em segmentos da geração
+# (segmentos/000001, ...) e as remoções em removidos.npy, até a próxima compactação
+EXTENSAO_BANCO = '.certibase'
+VERSAO_BANCO = 1
+MAX_SEGMENTOS = 32
+
+def _caminho_banco(caminho_xlsx):
+    return os.path.splitext(caminho_xlsx)[0] + EXTENSAO_BANCO
+
+def _substituir(caminho, gravar, modo='wb'):
+    # Grava em um arquivo temporário exclusivo na mesma pasta e substitui de uma vez: nunca deixa um arquivo pela
+    # metade, e gravações simultâneas do mesmo arquivo não compartilham o temporário
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), prefix=os.path.basename(caminho) + '.',
+                                             suffix='.tmp')
+    try:
+        with open(descritor, modo, **({} if 'b' in modo else {'encoding': 'utf-8'})) as f:
+            gravar(f)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+def _salvar_npy(caminho, array):
+    _substituir(caminho, lambda f: np.save(f, array))
+
+def _salvar_json(caminho, dados):
+    _substituir(caminho, lambda f: json.dump(dados, f, ensure_ascii=False), 'w')
+
+def _nova_pasta(pasta):
+    # Cria a próxima subpasta numerada (000001, ...); os.mkdir falha se outro processo a criou antes
+    os.makedirs(pasta, exist_ok=True)
+    while True:
+        existentes = [int(nome) for nome in os.listdir(pasta) if nome.isdigit()]
+        numero = max(existentes, default=0) + 1
+        try:
+            os.mkdir(os.path.join(pasta, f'{numero:06d}'))
+            return numero, os.path.join(pasta, f'{numero:06d}')
+        except FileExistsError:
+            continue
+
+_travas = {}
+_travas_lock = threading.Lock()
+
+# Escritas no mesmo banco (compilar, adicionar, remover, compactar) acontecem uma de cada vez: entre threads com
+# um RLock e entre processos com flock no arquivo "trava" do banco. Reentrante: adicionar chama remover e compactar
+@contextlib.contextmanager
+def _trava_escrita(caminho_banco):
+    with _travas_lock:
+        trava = _travas.setdefault(os.path.abspath(caminho_banco), {'rlock': threading.RLock(), 'nivel': 0,
+                                                                     'arquivo': None})
+    with trava['rlock']:
+        if trava['nivel'] == 0 and fcntl is not None:
+            os.makedirs(caminho_banco, exist_ok=True)
+            trava['arquivo'] = open(os.path.join(caminho_banco, 'trava'), 'a')
+            fcntl.flock(trava['arquivo'], fcntl.LOCK_EX)
+        trava['nivel'] += 1
+        try:
+            yield
+        finally:
+            trava['nivel'] -= 1
+            if trava['nivel'] == 0 and trava['arquivo'] is not None:
+                trava['arquivo'].close()  # fechar libera o flock
+                trava['arquivo'] = None
+
+def _nome_texto(nome):
+    return None if pd.isna(nome) else str(nome)
+
+def _gravar_matriz(destino, nomes, alelos, validos, meta):
+    # Só grava em pastas novas (geração ou segmento): meta.json vem por último e marca a pasta como completa
+    os.makedirs(destino, exist_ok=True)
+    _salvar_npy(os.path.join(destino, 'alelos.npy'), np.where(validos, alelos, 0).astype(np.float32))
+    _salvar_npy(os.path.join(destino, 'validos.npy'), np.packbits(validos, axis=1))
+    _salvar_json(os.path.join(destino, 'nomes.json'), [_nome_texto(nome) for nome in nomes])
+    _salvar_json(os.path.join(destino, 'meta.json'),
+                 dict(meta, linhas=int(alelos.shape[0]), locos=int(alelos.shape[1])))
+
+def _ler_matriz(pasta, meta):
+    alelos = np.load(os.path.join(pasta, 'alelos.npy'), mmap_mode='r')
+    bits = np.load(os.path.join(pasta, 'validos.npy'), mmap_mode='r')
+    validos = np.unpackbits(bits, axis=1, count=meta['locos']).view(bool)
+    with open(os.path.join(pasta, 'nomes.json'), encoding='utf-8') as f:
+        nomes = np.array(json.load(f), dtype=object)
+    return nomes, alelos, validos
+
+def _ajustar_locos(alelos, validos, n_locos):
+    sobra = n_locos - alelos.shape[1]
+    if sobra < 0:
+        return alelos[:, :n_locos], validos[:, :n_locos]
+    return np.pad(alelos, ((0, 0), (0, sobra))), np.pad(validos, ((0, 0), (0, sobra)))
+
+# Pasta da geração atual do banco; bancos gravados antes das gerações têm os arquivos na própria raiz
+def pasta_da_geracao(caminho_banco):
+    try:
+        with open(os.path.join(caminho_banco, 'atual.json'), encoding='utf-8') as f:
+            return os.path.join(caminho_banco, 'geracoes', json.load(f)['geracao'])
+    except (OSError, ValueError, KeyError):
+        return caminho_banco
 
-    return total_similarity / valid_loci_count
+# Grava a matriz como uma geração nova e aponta o banco para ela. A geração anterior fica até a próxima
+# publicação, para que leitores (outro processo, o servidor) que já a abriram terminem normalmente
+def _publicar_geracao(caminho_banco, nomes, alelos, validos, meta):
+    os.makedirs(caminho_banco, exist_ok=True)
+    anterior = pasta_da_geracao(caminho_banco)
+    numero, destino = _nova_pasta(os.path.join(caminho_banco, 'geracoes'))
+    _gravar_matriz(destino, nomes, alelos, validos, dict(meta, geracao=numero))
+    # A troca do ponteiro é atômica: até aqui os leitores continuam vendo a geração anterior inteira
+    _salvar_json(os.path.join(caminho_banco, 'atual.json'), {'geracao': os.path.basename(destino)})
+
+    # Limpeza: gerações anteriores à que acabou de ser substituída (as posteriores podem estar sendo gravadas
+    # por outro processo) e, uma publicação depois, os arquivos do formato sem gerações, na raiz
+    if anterior == caminho_banco:
+        return destino
+    numero_anterior = int(os.path.basename(anterior))
+    pasta = os.path.join(caminho_banco, 'geracoes')
+    for antiga in os.listdir(pasta):
+        if antiga.isdigit() and int(antiga) < numero_anterior:
+            shutil.rmtree(os.path.join(pasta, antiga), ignore_errors=True)
+    for antigo in ('segmentos', 'indice'):
+        shutil.rmtree(os.path.join(caminho_banco, antigo), ignore_errors=True)
+    for antigo in ('meta.json', 'alelos.npy', 'validos.npy', 'nomes.json', 'removidos.npy'):
+        if os.path.exists(os.path.join(caminho_banco, antigo)):
+            os.remove(os.path.join(caminho_banco, antigo))
+    return destino
+
+# Função para compilar a planilha do banco de dados em matriz float32, máscara de bits e índice de nomes
+def compilar_banco(caminho_xlsx, destino=None):
+    destino = destino or _caminho_banco(caminho_xlsx)
+    estado = os.stat(caminho_xlsx)
+    df = pd.read_excel(caminho_xlsx, engine='openpyxl', header=None)
+    nomes, alelos, validos = preparar_matriz(df)
+
+    # Linhas sem nenhum alelo válido (títulos, notas de rodapé) nunca têm similaridade
+    linhas = validos.any(axis=1)
+    nomes, alelos, validos = nomes[linhas], alelos[linhas], validos[linhas]
+
+    # A planilha é a fonte de verdade: a geração nova não tem segmentos nem remoções, e os resultados guardados
+    # são descartados
+    with _trava_escrita(destino):
+        _publicar_geracao(destino, nomes, alelos, validos, {
+            'versao': VERSAO_BANCO,
+            'origem': os.path.abspath(caminho_xlsx),
+            'origem_mtime_ns': estado.st_mtime_ns,
+            'origem_tamanho': estado.st_size,
+        })
+        shutil.rmtree(os.path.join(destino, 'cache'), ignore_errors=True)
+    return destino
+
+def _ler_meta(caminho_banco):
+    try:
+        with open(os.path.join(caminho_banco, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _banco_atualizado(caminho_banco, caminho_xlsx):
+    meta = _ler_meta(pasta_da_geracao(caminho_banco))
+    if meta is None or meta.get('versao') != VERSAO_BANCO:
+        return False
+    estado = os.stat(caminho_xlsx)
+    return meta['origem_mtime_ns'] == estado.st_mtime_ns and meta['origem_tamanho'] == estado.st_size
+
+# Função para obter a pasta do banco compilado, recompilando quando a planilha de origem foi alterada
+def resolver_banco(caminho):
+    if os.path.isdir(caminho):
+        caminho_banco = caminho
+    else:
+        caminho_banco = _caminho_banco(caminho)
+        if not _banco_atualizado(caminho_banco, caminho):
+            # Quem espera a trava confere de novo: a planilha pode ter sido compilada por outro processo
+            with _trava_escrita(caminho_banco):
+                if not _banco_atualizado(caminho_banco, caminho):
+                    compilar_banco(caminho, caminho_banco)
+    if _ler_meta(pasta_da_geracao(caminho_banco)) is None:
+        raise FileNotFoundError(f"Banco compilado não encontrado: {caminho_banco}")
+    return caminho_banco
+
+# As funções abaixo recebem a pasta da geração atual (pasta_da_geracao)
+def _segmentos(geracao):
+    pasta = os.path.join(geracao, 'segmentos')
+    if not os.path.isdir(pasta):
+        return []
+    # Segmentos sem meta.json foram interrompidos durante a gravação e são ignorados
+    return [os.path.join(pasta, nome) for nome in sorted(os.listdir(pasta))
+            if _ler_meta(os.path.join(pasta, nome)) is not None]
+
+def _ler_removidos(geracao):
+    caminho = os.path.join(geracao, 'removidos.npy')
+    return np.load(caminho) if os.path.exists(caminho) else np.empty(0, dtype=np.int64)
+
+def _partes_do_banco(geracao):
+    pastas = [geracao] + _segmentos(geracao)
+    return [(pasta, _ler_meta(pasta)) for pasta in pastas]
+
+def _linhas_vivas(partes, removidos):
+    vivos = np.ones(sum(meta['linhas'] for _, meta in partes), dtype=bool)
+    vivos[removidos] = False
+    return vivos
+
+# Função para abrir o banco compilado (mmap), juntando os segmentos e descartando as linhas removidas
+def carregar_banco(caminho):
+    geracao = pasta_da_geracao(resolver_banco(caminho))
+    partes = _partes_do_banco(geracao)
+    matrizes = [_ler_matriz(pasta, meta) for pasta, meta in partes]
+    removidos = _ler_removidos(geracao)
+    if len(matrizes) == 1 and len(removidos) == 0:
+        return matrizes[0]
+
+    vivos = _linhas_vivas(partes, removidos)
+    nomes = np.concatenate([nomes for nomes, _, _ in matrizes])[vivos]
+    alelos = np.concatenate([alelos for _, alelos, _ in matrizes])[vivos]
+    validos = np.concatenate([validos for _, _, validos in matrizes])[vivos]
+    return nomes, alelos, validos
+
+# Função para acrescentar acessos ao banco compilado como um novo segmento, sem recompilar o restante.
+# Com `substituir`, acessos já existentes com o mesmo nome são removidos
+def adicionar_ao_banco(caminho, novos_df, substituir=True):
+    caminho_banco = resolver_banco(caminho)
+    nomes, alelos, validos = preparar_matriz(novos_df)
+    linhas = validos.any(axis=1)
+    nomes, alelos, validos = nomes[linhas], alelos[linhas], validos[linhas]
+    with _trava_escrita(caminho_banco):
+        geracao = pasta_da_geracao(caminho_banco)
+        alelos, validos = _ajustar_locos(alelos, validos, _ler_meta(geracao)['locos'])
+
+        if substituir:
+            remover_do_banco(caminho_banco, [_nome_texto(nome) for nome in nomes])
+
+        numero, pasta = _nova_pasta(os.path.join(geracao, 'segmentos'))
+        _gravar_matriz(pasta, nomes, alelos, validos, {'segmento': numero})
+
+        if len(_segmentos(geracao)) > MAX_SEGMENTOS:
+            compactar_banco(caminho_banco)
+    return int(len(nomes))
+
+# Função para remover do banco compilado todos os acessos com os nomes indicados (marcação, sem regravar)
+def remover_do_banco(caminho, nomes):
+    caminho_banco = resolver_banco(caminho)
+    with _trava_escrita(caminho_banco):
+        geracao = pasta_da_geracao(caminho_banco)
+        partes = _partes_do_banco(geracao)
+        removidos = _ler_removidos(geracao)
+        todos = np.concatenate([_ler_matriz(pasta, meta)[0] for pasta, meta in partes])
+        vivos = _linhas_vivas(partes, removidos)
+        alvo = np.flatnonzero(vivos & np.isin(todos, np.array(list(nomes), dtype=object)))
+        if len(alvo):
+            _salvar_npy(os.path.join(geracao, 'removidos.npy'), np.union1d(removidos, alvo).astype(np.int64))
+    return int(len(alvo))
+
+# Função para compactar o banco: grava uma geração nova com os segmentos e sem as linhas removidas
+def compactar_banco(caminho):
+    caminho_banco = resolver_banco(caminho)
+    with _trava_escrita(caminho_banco):
+        geracao = pasta_da_geracao(caminho_banco)
+        if not _segmentos(geracao) and len(_ler_removidos(geracao)) == 0:
+            return caminho_banco
+        nomes, alelos, validos = carregar_banco(caminho_banco)
+        # As origens continuam as mesmas, para que a planilha não seja recompilada por cima da compactação
+        _publicar_geracao(caminho_banco, nomes.copy(), np.array(alelos), validos.copy(), _ler_meta(geracao))
+    return caminho_banco
+
+def _indice_da_parte(pasta, meta, tamanho_bloco):
+    pasta_indice = os.path.join(pasta, 'indice')
+    chave = {'banco': meta, 'tamanho_bloco': tamanho_bloco, 'versao': VERSAO_INDICE}
+    if _ler_meta(pasta_indice) == chave:
+        with np.load(os.path.join(pasta_indice, 'indice.npz')) as arquivo:
+            return dict(arquivo)
+
+    _, alelos, validos = _ler_matriz(pasta, meta)
+    indice = construir_indice(alelos, validos, tamanho_bloco)
+    os.makedirs(pasta_indice, exist_ok=True)
+    _substituir(os.path.join(pasta_indice, 'indice.npz'), lambda f: np.savez(f, **indice))
+    _salvar_json(os.path.join(pasta_indice, 'meta.json'), chave)
+    return indice
+
+# Função para carregar o índice de pré-filtragem de um banco. Cada segmento tem seu próprio índice, construído
+# uma vez e salvo na pasta do segmento; os índices são combinados e renumerados sem as linhas removidas
+def carregar_indice(caminho, tamanho_bloco=TAMANHO_BLOCO_INDICE):
+    geracao = pasta_da_geracao(resolver_banco(caminho))
+    partes = _partes_do_banco(geracao)
+    indices = [_indice_da_parte(pasta, meta, tamanho_bloco) for pasta, meta in partes]
+    if len(indices) == 1 and not os.path.exists(os.path.join(geracao, 'removidos.npy')):
+        return indices[0]
+
+    deslocamentos = np.cumsum([0] + [meta['linhas'] for _, meta in partes])
+    ordem = np.concatenate([np.where(indice['ordem'] >= 0, indice['ordem'] + deslocamento, -1)
+                            for indice, deslocamento in zip(indices, deslocamentos)])
+    vivos = _linhas_vivas(partes, _ler_removidos(geracao))
+    nova_posicao = np.where(vivos, np.cumsum(vivos) - 1, -1)
+    return {
+        'ordem': np.where(ordem >= 0, nova_posicao[np.maximum(ordem, 0)], -1),
+        'minimo': np.concatenate([indice['minimo'] for indice in indices]),
+        'maximo': np.concatenate([indice['maximo'] for indice in indices]),
+        'validos_min': np.concatenate([indice['validos_min'] for indice in indices]),
+        'tamanho_bloco': np.int64(tamanho_bloco),
+    }
+
+# Cache de resultados: tabelas já calculadas ficam em "<banco>.certibase/cache", com a chave derivada do
+# conteúdo do banco, do arquivo de consultas e dos parâmetros. As menos usadas são apagadas acima do limite
+VERSAO_CACHE = 2
+TAMANHO_MAX_CACHE = 256 * 2**20
+
+def _atualizar_hash(h, caminho):
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(2**20), b''):
+            h.update(bloco)
+
+# Função para calcular a chave do cache (conteúdo do banco compilado + consultas + parâmetros)
+def chave_cache(caminho_banco, caminho_query, **parametros):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps([VERSAO_CACHE, parametros], sort_keys=True).encode())
+    geracao = pasta_da_geracao(caminho_banco)
+    for pasta, _ in _partes_do_banco(geracao):
+        for nome in ('alelos.npy', 'validos.npy', 'nomes.json'):
+            _atualizar_hash(h, os.path.join(pasta, nome))
+    if os.path.exists(os.path.join(geracao, 'removidos.npy')):
+        _atualizar_hash(h, os.path.join(geracao, 'removidos.npy'))
+    _atualizar_hash(h, caminho_query)
+    return h.hexdigest()
+
+def ler_cache(pasta_cache, chave):
+    caminho = os.path.join(pasta_cache, chave + '.pkl')
+    try:
+        tabela = pd.read_pickle(caminho)
+        os.utime(caminho)  # a data de modificação marca o último uso
+    except (OSError, ValueError, EOFError):
+        return None
+    return tabela
+
+def gravar_cache(pasta_cache, chave, tabela, tamanho_max=TAMANHO_MAX_CACHE):
+    os.makedirs(pasta_cache, exist_ok=True)
+    caminho = os.path.join(pasta_cache, chave + '.pkl')
+    _substituir(caminho, tabela.to_pickle)
+    _limitar_cache(pasta_cache, tamanho_max)
+
+def _limitar_cache(pasta_cache, tamanho_max):
+    entradas = []
+    for nome in os.listdir(pasta_cache):
+        if nome.endswith('.pkl'):
+            try:
+                estado = os.stat(os.path.join(pasta_cache, nome))
+            except FileNotFoundError:  # apagada por outro processo
+                continue
+            entradas.append((estado.st_mtime_ns, estado.st_size, nome))
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    # Remove as entradas usadas há mais tempo até caber no limite (a mais recente sempre fica)
+    for _, tamanho, nome in sorted(entradas)[:-1]:
+        if total <= tamanho_max:
+            break
+        try:
+            os.remove(os.path.join(pasta_cache, nome))
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+
+# Função para ler uma planilha de consultas ou de banco (.xlsx/.xls ou .csv), sem cabeçalho
+def ler_planilha(caminho):
+    if caminho.lower().endswith('.csv'):
+        return pd.read_csv(caminho, header=None)
+    return pd.read_excel(caminho, engine='openpyxl', header=None)
+
+# Função principal da API: compara o arquivo de consultas com o banco e, opcionalmente, salva a tabela
+def comparar_arquivos(caminho_banco, caminho_query, caminho_saida=None, k=RESULTADOS_POR_CONSULTA, limiar=0.0,
+                      prefiltro=False, processos=1, linhas_por_bloco=LINHAS_POR_BLOCO, cache=True,
+                      tamanho_cache=TAMANHO_MAX_CACHE):
+    # O prefiltro e o paralelismo não mudam o resultado e não entram na chave do cache
+    caminho_banco = resolver_banco(caminho_banco)
+    pasta_cache = os.path.join(caminho_banco, 'cache')
+    chave = chave_cache(caminho_banco, caminho_query, k=k, limiar=limiar) if cache else None
+    tabela = ler_cache(pasta_cache, chave) if cache else None
+    if tabela is None:
+        nomes_banco, banco, banco_validos = carregar_banco(caminho_banco)
+        indice = carregar_indice(caminho_banco) if prefiltro else None
+        tabela = comparar_lote(ler_planilha(caminho_query), nomes_banco, banco, banco_validos, k, limiar, indice,
+                               processos, linhas_por_bloco)
+        if cache:
+            gravar_cache(pasta_cache, chave, tabela, tamanho_cache)
+    if caminho_saida:
+        exportar_resultados(tabela, caminho_saida)
+    return tabela
 
 # Função para carregar o arquivo Excel e exibir o nome do arquivo selecionado
 def carregar_arquivo(entry_widget):
+    import tkinter as tk
+    from tkinter import filedialog
     filename = filedialog.askopenfilename()
     entry_widget.delete(0, tk.END)
     entry_widget.insert(0, filename)
 
 # Função para calcular a similaridade entre os arquivos Excel selecionados
 def validar_similaridade():
+    global ultimo_resultado
     banco_de_dados_filename = entry_banco_de_dados.get()
-    banco_de_dados = pd.read_excel(banco_de_dados_filename, engine='openpyxl', header=None)
-
     query_filename = entry_query.get()
-    query_df = pd.read_excel(query_filename, engine='openpyxl', header=None)
 
-    similarities = {}
-
-    for index_query, query_row in query_df.iterrows():
-        query_name = query_row.iloc[0]
-        query_row = query_row.iloc[1:]
-
-        for index_banco, banco_row in banco_de_dados.iterrows():
-            db_name = banco_row.iloc[0]
-            banco_row = banco_row.iloc[1:]
-
-            similarity = calcular_similaridade(query_row, banco_row)
-            similarities[db_name] = similarity
+    # Repetir a mesma consulta contra o mesmo banco usa o resultado guardado no cache
+    ultimo_resultado = comparar_arquivos(banco_de_dados_filename, query_filename, k=results_number)
 
-    similarities = dict(sorted(similarities.items(), key=lambda x: x[1], reverse=True))
-    similarities = {k: similarities[k] for k in list(similarities)[:results_number]}
+    # A janela mostra o ranking da última consulta; a tabela completa pode ser exportada
+    similarities = {}
+    if len(ultimo_resultado):
+        ultima_consulta = ultimo_resultado.tail(ultimo_resultado['Rank'].iloc[-1])
+        similarities = dict(zip(ultima_consulta['Reference'], ultima_consulta['Similarity']))
 
     similarity_n = 0
     for similarity in similarities.keys():
@@ -69,34 +794,119 @@ def validar_similaridade():
     if not similarities:
         resultado_label.config(text="Não foi encontrada similaridade.")
 
-root = tk.Tk()
-root.title("CertBase")
-
-label_banco_de_dados = tk.Label(root, text="Select the database:")
-label_banco_de_dados.grid(row=0, column=0, padx=10, pady=5)
-entry_banco_de_dados = tk.Entry(root, width=50)
-entry_banco_de_dados.grid(row=0, column=1, padx=10, pady=5)
-btn_banco_de_dados = tk.Button(root, text="Select", command=lambda: carregar_arquivo(entry_banco_de_dados))
-btn_banco_de_dados.grid(row=0, column=2, padx=10, pady=5)
-
-label_query = tk.Label(root, text="Select the crop file:")
-label_query.grid(row=1, column=0, padx=10, pady=5)
-entry_query = tk.Entry(root, width=50)
-entry_query.grid(row=1, column=1, padx=10, pady=5)
-btn_query = tk.Button(root, text="Select", command=lambda: carregar_arquivo(entry_query))
-btn_query.grid(row=1, column=2, padx=10, pady=5)
-
-btn_calcular = tk.Button(root, text="Calculate similarity", command=validar_similaridade)
-btn_calcular.grid(row=2, column=0, columnspan=3, padx=10, pady=5)
-
-results_number = 3
-starting_row = 3
-results_texts = {}
-result_n = 0
-while result_n < results_number:
-    resultado_label = tk.Label(root, text="")
-    resultado_label.grid(row=starting_row + result_n, column=0, columnspan=3, padx=10, pady=5)
-    results_texts[result_n] = resultado_label
-    result_n += 1
-
-root.mainloop()
+# Função para salvar os rankings de todas as consultas em um único arquivo
+def exportar_lote():
+    from tkinter import filedialog
+    if ultimo_resultado is None:
+        validar_similaridade()
+    filename = filedialog.asksaveasfilename(defaultextension=".xlsx",
+                                            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+    if filename:
+        exportar_resultados(ultimo_resultado, filename)
+
+# Interface gráfica (tkinter é importado apenas aqui)
+def iniciar_interface():
+    global entry_banco_de_dados, entry_query, results_number, results_texts, resultado_label, ultimo_resultado
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.title("CertBase")
+
+    label_banco_de_dados = tk.Label(root, text="Select the database:")
+    label_banco_de_dados.grid(row=0, column=0, padx=10, pady=5)
+    entry_banco_de_dados = tk.Entry(root, width=50)
+    entry_banco_de_dados.grid(row=0, column=1, padx=10, pady=5)
+    btn_banco_de_dados = tk.Button(root, text="Select", command=lambda: carregar_arquivo(entry_banco_de_dados))
+    btn_banco_de_dados.grid(row=0, column=2, padx=10, pady=5)
+
+    label_query = tk.Label(root, text="Select the crop file:")
+    label_query.grid(row=1, column=0, padx=10, pady=5)
+    entry_query = tk.Entry(root, width=50)
+    entry_query.grid(row=1, column=1, padx=10, pady=5)
+    btn_query = tk.Button(root, text="Select", command=lambda: carregar_arquivo(entry_query))
+    btn_query.grid(row=1, column=2, padx=10, pady=5)
+
+    btn_calcular = tk.Button(root, text="Calculate similarity", command=validar_similaridade)
+    btn_calcular.grid(row=2, column=0, columnspan=3, padx=10, pady=5)
+
+    results_number = 3
+    starting_row = 3
+    results_texts = {}
+    result_n = 0
+    while result_n < results_number:
+        resultado_label = tk.Label(root, text="")
+        resultado_label.grid(row=starting_row + result_n, column=0, columnspan=3, padx=10, pady=5)
+        results_texts[result_n] = resultado_label
+        result_n += 1
+
+    ultimo_resultado = None
+    btn_exportar = tk.Button(root, text="Export results", command=exportar_lote)
+    btn_exportar.grid(row=starting_row + results_number, column=0, columnspan=3, padx=10, pady=5)
+
+    root.mainloop()
+
+# Linha de comando: sem argumentos abre a interface gráfica
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CertiBase: genetic similarity between queries and a cultivar database.")
+    subparsers = parser.add_subparsers(dest='command')
+
+    compile_parser = subparsers.add_parser('compile', help="Compile the database spreadsheet into a .certibase store")
+    compile_parser.add_argument('database', help="Database spreadsheet (.xlsx)")
+    compile_parser.add_argument('-o', '--output', help="Destination folder (default: <database>.certibase)")
+
+    compare_parser = subparsers.add_parser('compare', help="Rank the database references for every query")
+    compare_parser.add_argument('database', help="Database spreadsheet (.xlsx) or compiled .certibase folder")
+    compare_parser.add_argument('queries', help="Query spreadsheet (.xlsx or .csv)")
+    compare_parser.add_argument('-o', '--output', help="Results table (.csv or .xlsx); printed when omitted")
+    compare_parser.add_argument('-k', '--top', type=int, default=RESULTADOS_POR_CONSULTA,
+                                help="Number of references per query (default: %(default)s)")
+    compare_parser.add_argument('-m', '--min-similarity', type=float, default=0.0,
+                                help="Drop references below this similarity, 0-1 (default: %(default)s)")
+    compare_parser.add_argument('--prefilter', action='store_true',
+                                help="Skip database blocks that cannot reach the minimum similarity or the top k (single process)")
+    compare_parser.add_argument('-w', '--workers', type=int, default=1,
+                                help="Worker processes for the exhaustive scan, not combinable with --prefilter; 0 uses every core "
+                                     "(default: %(default)s)")
+    compare_parser.add_argument('--block-size', type=int, default=LINHAS_POR_BLOCO,
+                                help="Database rows per parallel task (default: %(default)s)")
+    compare_parser.add_argument('--no-cache', action='store_true',
+                                help="Always recompute instead of reusing results stored in <database>.certibase/cache")
+    compare_parser.add_argument('--cache-size', type=int, default=TAMANHO_MAX_CACHE // 2**20,
+                                help="Size limit of the results cache in MB (default: %(default)s)")
+
+    add_parser = subparsers.add_parser('add', help="Append accessions to a compiled database without recompiling it")
+    add_parser.add_argument('database', help="Database spreadsheet (.xlsx) or compiled .certibase folder")
+    add_parser.add_argument('accessions', help="Spreadsheet with the new accessions (.xlsx or .csv)")
+    add_parser.add_argument('--keep-existing', action='store_true',
+                            help="Keep accessions that already exist with the same name instead of replacing them")
+
+    remove_parser = subparsers.add_parser('remove', help="Remove accessions by name from a compiled database")
+    remove_parser.add_argument('database', help="Database spreadsheet (.xlsx) or compiled .certibase folder")
+    remove_parser.add_argument('names', nargs='+', help="Accession names")
+
+    compact_parser = subparsers.add_parser('compact', help="Merge added and removed accessions into the main matrix")
+    compact_parser.add_argument('database', help="Database spreadsheet (.xlsx) or compiled .certibase folder")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        iniciar_interface()
+    elif args.command == 'compile':
+        print(compilar_banco(args.database, args.output))
+    elif args.command == 'compare':
+        if args.prefilter and args.workers != 1:
+            parser.error("--prefilter runs in a single process and cannot be combined with --workers")
+        tabela = comparar_arquivos(args.database, args.queries, args.output, args.top, args.min_similarity,
+                                   args.prefilter, args.workers or None, args.block_size, not args.no_cache,
+                                   args.cache_size * 2**20)
+        if not args.output:
+            print(tabela.to_string(index=False))
+    elif args.command == 'add':
+        n = adicionar_ao_banco(args.database, ler_planilha(args.accessions), not args.keep_existing)
+        print(f"{n} accessions added")
+    elif args.command == 'remove':
+        print(f"{remover_do_banco(args.database, args.names)} accessions removed")
+    elif args.command == 'compact':
+        print(compactar_banco(args.database))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import CertiBase as cb
+
+N_LOCOS = 12
+
+
+def _acessos(rng, n, prefixo, familias):
+    # Acessos derivados de poucas "cultivares" base, para que existam pares muito próximos e empates
+    alelos = familias[rng.integers(0, len(familias), n)] + rng.integers(-3, 4, (n, N_LOCOS))
+    alelos = alelos.astype(object)
+    alelos[rng.random(alelos.shape) < 0.05] = None
+    return [[f'{prefixo}{i}', *linha] for i, linha in enumerate(alelos.tolist())]
+
+
+def _planilha(caminho, linhas):
+    cabecalho = [[None, 'Banco'], [None] + [f'SSR-{j + 1}' for j in range(N_LOCOS)]]
+    pd.DataFrame(cabecalho + linhas).to_excel(caminho, header=False, index=False)
+    return str(caminho)
+
+
+@pytest.fixture
+def dados():
+    rng = np.random.default_rng(0)
+    familias = rng.integers(80, 300, (20, N_LOCOS))
+    banco = _acessos(rng, 600, 'A', familias)
+    consultas = pd.DataFrame(_acessos(rng, 30, 'Q', familias))
+    # Zeros nas consultas são locos válidos com similaridade 0
+    consultas.iloc[::4, 3] = 0
+    return rng, familias, banco, consultas
+
+
+@pytest.mark.parametrize('k, limiar, tamanho_bloco', [(1, 0.0, 16), (5, 0.0, 64), (5, 0.97, 16), (40, 0.9, 32)])
+def test_prefiltro_igual_a_busca_completa(dados, k, limiar, tamanho_bloco):
+    _, _, banco, consultas = dados
+    nomes, alelos, validos = cb.preparar_matriz(pd.DataFrame(banco))
+    indice = cb.construir_indice(alelos, validos, tamanho_bloco)
+
+    completa = cb.comparar_lote(consultas, nomes, alelos, validos, k, limiar)
+    filtrada = cb.comparar_lote(consultas, nomes, alelos, validos, k, limiar, indice)
+
+    # Empates podem trocar a referência, nunca a similaridade de cada posição do ranking
+    pd.testing.assert_frame_equal(completa.drop(columns='Reference'), filtrada.drop(columns='Reference'))
+    similaridade = cb.matriz_similaridade(*cb.preparar_matriz(consultas, zero_ausente=False)[1:], alelos, validos)
+    linha = {nome: i for i, nome in enumerate(consultas.iloc[:, 0])}
+    coluna = {nome: i for i, nome in enumerate(nomes)}
+    obtida = [similaridade[linha[q], coluna[r]] for q, r in zip(filtrada['Query'], filtrada['Reference'])]
+    np.testing.assert_allclose(obtida, filtrada['Similarity'])
+
+
+def test_limites_superiores_cobrem_todas_as_linhas(dados):
+    _, _, banco, consultas = dados
+    nomes, alelos, validos = cb.preparar_matriz(pd.DataFrame(banco))
+    _, query, query_validos = cb.preparar_matriz(consultas, zero_ausente=False)
+    indice = cb.construir_indice(alelos, validos, 32)
+
+    similaridade = cb.matriz_similaridade(query, query_validos, alelos, validos)
+    limites = cb.limites_superiores(query, query_validos, indice)
+    ordem = indice['ordem']
+    bloco = np.empty(len(alelos), dtype=np.int64)
+    bloco[ordem[ordem >= 0]] = np.flatnonzero(ordem >= 0) // 32
+    assert (similaridade <= limites[:, bloco] + 1e-9).all()
+
+
+def test_prefiltro_descarta_blocos():
+    # Muitas cultivares: nenhum loco sozinho separa os grupos, os blocos precisam ser próximos em todos
+    rng = np.random.default_rng(2)
+    familias = rng.integers(80, 300, (150, N_LOCOS))
+    nomes, alelos, validos = cb.preparar_matriz(pd.DataFrame(_acessos(rng, 3000, 'A', familias)))
+    _, query, query_validos = cb.preparar_matriz(pd.DataFrame(_acessos(rng, 30, 'Q', familias)), zero_ausente=False)
+    indice = cb.construir_indice(alelos, validos)
+
+    # Linhas de blocos com limite abaixo do limiar nunca são pontuadas
+    limites = cb.limites_superiores(query, query_validos, indice)
+    linhas = (indice['ordem'] >= 0).reshape(limites.shape[1], -1).sum(axis=1)
+    descartadas = ((limites < 0.9) * linhas).sum(axis=1) / len(alelos)
+    assert np.median(descartadas) > 0.5
+
+
+def test_prefiltro_sem_grupos_usa_busca_completa():
+    # Alelos sem parentesco: quase nenhum bloco é descartado e as consultas vão para a busca completa
+    rng = np.random.default_rng(1)
+    alelos = rng.integers(80, 300, (500, N_LOCOS)).astype(np.float64)
+    validos = np.ones(alelos.shape, dtype=bool)
+    indice = cb.construir_indice(alelos, validos, 16)
+    query, query_validos = alelos[:40] + 1, validos[:40]
+
+    completa = cb.melhores_por_consulta(query, query_validos, alelos, validos, 3, 0.0)
+    filtrada = cb.melhores_por_consulta(query, query_validos, alelos, validos, 3, 0.0, indice)
+    np.testing.assert_array_equal(completa[1], filtrada[1])
+
+
+def _conferir_banco(caminho, referencia, consultas):
+    for a, b in zip(cb.carregar_banco(referencia), cb.carregar_banco(caminho)):
+        np.testing.assert_array_equal(np.asarray(a), np.asarray(b))
+    tabelas = []
+    for pasta in (referencia, caminho):
+        nomes, alelos, validos = cb.carregar_banco(pasta)
+        tabelas.append(cb.comparar_lote(consultas, nomes, alelos, validos, 5, 0.0, cb.carregar_indice(pasta, 16)))
+    pd.testing.assert_frame_equal(*tabelas)
+
+
+def test_adicionar_remover_compactar_igual_a_recompilar(dados, tmp_path):
+    rng, familias, banco, consultas = dados
+    novos = _acessos(rng, 15, 'N', familias)
+    novos[3][0] = 'A10'  # substitui um acesso existente
+    extras = _acessos(rng, 3, 'M', familias)
+
+    caminho = cb.compilar_banco(_planilha(tmp_path / 'banco.xlsx', banco))
+    cb.carregar_indice(caminho, 16)
+    cb.remover_do_banco(caminho, ['A1', 'A2', 'inexistente'])
+    cb.adicionar_ao_banco(caminho, pd.DataFrame(novos))
+    cb.remover_do_banco(caminho, ['N0', 'A599'])
+    cb.adicionar_ao_banco(caminho, pd.DataFrame(extras))
+
+    # O mesmo conteúdo compilado do zero: acessos vivos do banco, depois os adicionados, na ordem de entrada
+    fora = {'A1', 'A2', 'A10', 'N0', 'A599'}
+    esperadas = [linha for linha in banco if linha[0] not in fora]
+    esperadas += [linha for linha in novos if linha[0] not in fora - {'A10'}] + extras
+    referencia = cb.compilar_banco(_planilha(tmp_path / 'referencia.xlsx', esperadas))
+
+    _conferir_banco(caminho, referencia, consultas)
+    cb.compactar_banco(caminho)
+    assert not cb._segmentos(cb.pasta_da_geracao(caminho))
+    assert not len(cb._ler_removidos(cb.pasta_da_geracao(caminho)))
+    _conferir_banco(caminho, referencia, consultas)
+
+
+def test_compactacao_interrompida_mantem_o_banco(dados, tmp_path, monkeypatch):
+    rng, familias, banco, consultas = dados
+    caminho = cb.compilar_banco(_planilha(tmp_path / 'banco.xlsx', banco))
+    cb.adicionar_ao_banco(caminho, pd.DataFrame(_acessos(rng, 5, 'N', familias)))
+    cb.remover_do_banco(caminho, ['A2', 'A3'])
+    antes = [np.array(parte) for parte in cb.carregar_banco(caminho)]
+
+    salvar_json = cb._salvar_json
+
+    def interromper(destino, dados_json):
+        # Falha justamente na troca do ponteiro, depois de a geração nova estar gravada
+        if destino.endswith('atual.json'):
+            raise KeyboardInterrupt
+        salvar_json(destino, dados_json)
+
+    monkeypatch.setattr(cb, '_salvar_json', interromper)
+    with pytest.raises(KeyboardInterrupt):
+        cb.compactar_banco(caminho)
+    monkeypatch.setattr(cb, '_salvar_json', salvar_json)
+
+    for a, b in zip(antes, cb.carregar_banco(caminho)):
+        np.testing.assert_array_equal(a, np.asarray(b))
+    cb.compactar_banco(caminho)
+    for a, b in zip(antes, cb.carregar_banco(caminho)):
+        np.testing.assert_array_equal(a, np.asarray(b))
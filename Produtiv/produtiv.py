@@ -1,25 +1,258 @@
+import argparse
+import contextlib
+import cProfile
+import csv
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import tempfile
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from scipy import stats
-import warnings
-warnings.filterwarnings('ignore')
 
-def load_abundance_data(file):
+TAXONOMY_COLS = ['Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
+
+# Modelo de fazendas padrão: produtividade (kg/ha) de cada fazenda e padrões (regex com o grupo "farm")
+# das colunas de amostras antes (A) e depois (B) do cultivo. Pode ser substituído por um arquivo JSON
+DEFAULT_MODEL = {
+    'productivity': {
+        'F3': 3500,
+        'F4': 9500,
+        'F5': 7500,
+        'F6': 11000
+    },
+    'before_pattern': r'^(?P<farm>F\d+)A',
+    'after_pattern': r'^(?P<farm>F\d+)B',
+}
+FARMS = list(DEFAULT_MODEL['productivity'])
+
+# Formatos colunares (pyarrow); os demais arquivos são tratados como CSV
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather', '.arrow')
+
+# Número de espécies por bloco no modo de leitura em blocos (streaming)
+DEFAULT_CHUNKSIZE = 50000
+
+# Máximo de arquivos de blocos abertos ao mesmo tempo na intercalação final
+MERGE_FAN_IN = 64
+
+# Limite de elementos das matrizes espécies × reamostragens calculadas de uma vez
+RESAMPLING_BLOCK_ELEMENTS = 1 << 22
+
+# Intervalo mínimo, em segundos, entre duas mensagens de progresso
+PROGRESS_INTERVAL = 1.0
+
+# Cache de resultados: versão do formato e tamanho máximo padrão da pasta (bytes)
+CACHE_VERSION = 1
+DEFAULT_CACHE_SIZE = 512 * 2**20
+
+try:
+    import resource  # pico de memória do processo (não existe no Windows)
+except ImportError:
+    resource = None
+
+def _extension(file):
+    return os.path.splitext(file)[1].lower()
+
+def read_columns(file):
+    """
+    Lista as colunas do arquivo de abundância sem ler os dados.
+    """
+    ext = _extension(file)
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file).schema_arrow.names
+    if ext in ('.feather', '.arrow'):
+        import pyarrow as pa
+        with pa.memory_map(file) as source:
+            return pa.ipc.open_file(source).schema.names
+    return list(pd.read_csv(file, nrows=0).columns)
+
+def load_farm_model(config_file=None):
+    """
+    Carrega o modelo de fazendas (produtividades e padrões de colunas) de um arquivo JSON,
+    completando com o modelo padrão as chaves ausentes.
+    """
+    model = dict(DEFAULT_MODEL)
+    if config_file:
+        with open(config_file, encoding='utf-8') as f:
+            model.update(json.load(f))
+    return model
+
+def map_farm_columns(columns, model=DEFAULT_MODEL):
+    """
+    Associa, em uma única passagem pelos cabeçalhos, cada fazenda às suas colunas antes e depois.
+    """
+    patterns = [re.compile(model['before_pattern']), re.compile(model['after_pattern'])]
+    mapping = {}
+    for col in columns:
+        if col in TAXONOMY_COLS:
+            continue
+        for stage, pattern in enumerate(patterns):
+            match = pattern.match(str(col))
+            if match:
+                mapping.setdefault(match.group('farm'), ([], []))[stage].append(col)
+                break
+    return mapping
+
+def project_columns(columns, farms=FARMS, model=DEFAULT_MODEL):
+    """
+    Seleciona as colunas de taxonomia e as amostras antes/depois das fazendas analisadas.
+    """
+    mapping = map_farm_columns(columns, model)
+    used = {col for farm in farms if farm in mapping for cols in mapping[farm] for col in cols}
+    return [col for col in columns if col in TAXONOMY_COLS or col in used]
+
+def _csv_dtypes(columns):
+    return {col: (str if col in TAXONOMY_COLS else np.float64) for col in columns}
+
+def load_abundance_data(file, farms=FARMS, model=DEFAULT_MODEL):
+    """
+    Carrega o arquivo de abundância (.csv, .parquet, .feather/.arrow) com dados taxonômicos e amostrais,
+    lendo apenas as colunas usadas na análise.
+    """
+    columns = project_columns(read_columns(file), farms, model)
+    ext = _extension(file)
+    if ext == '.parquet':
+        return pd.read_parquet(file, columns=columns)
+    if ext in ('.feather', '.arrow'):
+        return pd.read_feather(file, columns=columns)
+    try:
+        return pd.read_csv(file, usecols=columns, dtype=_csv_dtypes(columns))
+    except ValueError:
+        # Amostras com valores não numéricos: a conversão fica para calculate_species_variation
+        return pd.read_csv(file, usecols=columns, dtype={col: str for col in TAXONOMY_COLS})
+
+def iter_abundance_chunks(file, chunksize, farms=FARMS, model=DEFAULT_MODEL):
+    """
+    Lê o arquivo de abundância em blocos de até `chunksize` espécies, apenas com as colunas usadas.
+    """
+    columns = project_columns(read_columns(file), farms, model)
+    ext = _extension(file)
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif ext in ('.feather', '.arrow'):
+        import pyarrow as pa
+        with pa.memory_map(file) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(columns)
+                for start in range(0, batch.num_rows, chunksize):
+                    yield batch.slice(start, chunksize).to_pandas()
+    else:
+        # Só a taxonomia tem tipo fixo: um valor não numérico em uma amostra (ex.: 'ND') não interrompe a leitura,
+        # a conversão para número fica para calculate_species_variation, como no modo em memória
+        yield from pd.read_csv(file, usecols=columns, dtype={col: str for col in columns if col in TAXONOMY_COLS},
+                               chunksize=chunksize)
+
+def save_results(results_df, output_file):
+    """
+    Salva a tabela de resultados no formato indicado pela extensão (.csv, .parquet, .feather/.arrow).
+    """
+    ext = _extension(output_file)
+    if ext == '.parquet':
+        results_df.to_parquet(output_file, index=False)
+    elif ext in ('.feather', '.arrow'):
+        results_df.reset_index(drop=True).to_feather(output_file)
+    else:
+        results_df.to_csv(output_file, index=False)
+
+def _result_dtypes(columns):
+    text_cols = TAXONOMY_COLS + ['Farms_With_Data', 'Impact_Classification']
+    return {col: (str if col in text_cols else np.int64 if col == 'N_Farms_Present' else np.float64)
+            for col in columns}
+
+def convert_csv_results(csv_file, output_file, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Converte, em blocos, um CSV de resultados para o formato colunar indicado pela extensão.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    columns = list(pd.read_csv(csv_file, nrows=0).columns)
+    writer = schema = None
+    try:
+        # Tipos fixos por coluna, para que todos os blocos tenham o mesmo esquema. Só o campo vazio é ausente:
+        # textos como 'None' (Farms_With_Data) ou 'NA' (taxonomia) ficam como no modo em memória
+        for chunk in pd.read_csv(csv_file, dtype=_result_dtypes(columns), keep_default_na=False, na_values=[''],
+                                 chunksize=chunksize):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                if _extension(output_file) == '.parquet':
+                    writer = pq.ParquetWriter(output_file, schema)
+                else:
+                    writer = pa.ipc.new_file(output_file, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+def file_digest(file):
     """
-    Carrega o arquivo de abundância com dados taxonômicos e amostrais.
+    Hash do conteúdo de um arquivo (BLAKE2b), lido em blocos.
     """
-    return pd.read_csv(file)
+    h = hashlib.blake2b(digest_size=20)
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
 
-def calculate_productivity_factors():
+def cache_key(*parts):
+    """
+    Chave do cache a partir de hashes de arquivos e parâmetros serializáveis em JSON.
+    """
+    text = json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+def cache_get(cache_dir, key):
+    """
+    Tabela guardada no cache com a chave `key`, ou None. Cada leitura renova a entrada (LRU).
+    """
+    path = os.path.join(cache_dir, key + '.pkl')
+    try:
+        df = pd.read_pickle(path)
+    except (OSError, ValueError, EOFError):
+        return None
+    os.utime(path)
+    return df
+
+def cache_put(cache_dir, key, df, max_size=DEFAULT_CACHE_SIZE):
+    """
+    Guarda a tabela no cache e apaga as entradas usadas há mais tempo até a pasta caber em `max_size` bytes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.pkl')
+    df.to_pickle(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pkl'):
+            info = os.stat(os.path.join(cache_dir, name))
+            entries.append((info.st_mtime_ns, info.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries)[:-1]:
+        if total <= max_size:
+            break
+        os.remove(os.path.join(cache_dir, name))
+        total -= size
+
+def calculate_productivity_factors(productivity=None, verbose=True):
     """
     Define as produtividades de cada fazenda e calcula os fatores de ponderação.
     """
-    productivity = {
-        'F3': 3500,
-        'F4': 9500, 
-        'F5': 7500,
-        'F6': 11000
-    }
+    if productivity is None:
+        productivity = DEFAULT_MODEL['productivity']
     
     mean_productivity = np.mean(list(productivity.values()))
     
@@ -27,167 +260,229 @@ def calculate_productivity_factors():
     for farm, prod in productivity.items():
         factor = prod / mean_productivity
         productivity_factors[farm] = factor
-        print(f"{farm}: {prod} kg/ha | Fator: {factor:.4f} | Peso: {((factor-1)*100):+.1f}%")
+        if verbose:
+            print(f"{farm}: {prod} kg/ha | Fator: {factor:.4f} | Peso: {((factor-1)*100):+.1f}%")
     
     return productivity_factors, mean_productivity
 
-def calculate_species_variation(df):
+def calculate_species_variation(df, verbose=True, farms=FARMS, model=DEFAULT_MODEL):
     """
     Calcula a variação média (Depois - Antes) para cada espécie em cada fazenda.
     """
-    taxonomy_cols = ['Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
-    sample_cols = [col for col in df.columns if col not in taxonomy_cols]
+    if verbose:
+        print(f"Processando {len(df)} espécies...")
     
-    farms = ['F3', 'F4', 'F5', 'F6']
-    results = []
+    # Colunas de cada fazenda (Antes = A, Depois = B); fazendas sem as duas ficam ausentes
+    mapping = map_farm_columns(df.columns, model)
+    farms_with_data = [farm for farm in farms if farm in mapping and all(mapping[farm])]
+    groups = [cols for farm in farms_with_data for cols in mapping[farm]]
     
-    print(f"Processando {len(df)} espécies...")
+    # Médias das triplicatas de todas as fazendas de uma só vez: as colunas são agrupadas
+    # (antes, depois) por fazenda e somadas por grupo, ignorando NaN
+    n_species = len(df)
+    antes_mean = depois_mean = np.zeros((n_species, 0))
+    if groups:
+        samples = df[[col for cols in groups for col in cols]].apply(pd.to_numeric, errors='coerce')
+        values = samples.to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0.0)
+        sizes = [len(cols) for cols in groups]
+        if len(set(sizes)) == 1:
+            # Mesmo número de réplicas em todos os grupos (caso usual): uma única redução
+            sums = values.reshape(n_species, len(groups), sizes[0]).sum(axis=2)
+            counts = valid.reshape(n_species, len(groups), sizes[0]).sum(axis=2)
+        else:
+            bounds = np.cumsum([0] + sizes)
+            sums = np.column_stack([values[:, a:b].sum(axis=1) for a, b in zip(bounds[:-1], bounds[1:])])
+            counts = np.column_stack([valid[:, a:b].sum(axis=1) for a, b in zip(bounds[:-1], bounds[1:])])
+        # NaN (nenhuma réplica válida) substituído por 0
+        means = np.divide(sums, counts, out=np.zeros(sums.shape), where=counts > 0)
+        antes_mean, depois_mean = means[:, 0::2], means[:, 1::2]
     
-    for idx, (_, row) in enumerate(df.iterrows()):
-        if idx > 0 and idx % 100 == 0:
-            print(f"  Processadas {idx} espécies...")
-            
-        species_name = row['Species']
-        species_data = {
-            'Species': species_name,
-            'Phylum': row['Phylum'],
-            'Class': row['Class'],
-            'Order': row['Order'],
-            'Family': row['Family'],
-            'Genus': row['Genus']
-        }
-        
-        species_present_somewhere = False  # Flag para verificar se espécie tem dados
-        
-        for farm in farms:
-            # Colunas de cada fazenda (Antes = A, Depois = B)
-            antes_cols = [col for col in sample_cols if col.startswith(f'{farm}A')]
-            depois_cols = [col for col in sample_cols if col.startswith(f'{farm}B')]
-            
-            if antes_cols and depois_cols:
-                # Média das triplicatas antes e depois
-                antes_mean = pd.to_numeric(row[antes_cols], errors='coerce').mean()
-                depois_mean = pd.to_numeric(row[depois_cols], errors='coerce').mean()
-                
-                # Verifica se tem dados válidos
-                if not (pd.isna(antes_mean) and pd.isna(depois_mean)):
-                    species_present_somewhere = True
-                
-                # Substitui NaN por 0
-                antes_mean = 0 if pd.isna(antes_mean) else antes_mean
-                depois_mean = 0 if pd.isna(depois_mean) else depois_mean
-                
-                # Variação absoluta e relativa
-                variation_abs = depois_mean - antes_mean
-                
-                # Variação relativa (evita divisão por zero)
-                if antes_mean > 0:
-                    variation_rel = (depois_mean - antes_mean) / antes_mean
-                else:
-                    # Se antes era 0 e depois > 0, considera como aparecimento (100% de aumento)
-                    variation_rel = 1.0 if depois_mean > 0 else 0.0
-                
-                species_data[f'{farm}_antes_mean'] = antes_mean
-                species_data[f'{farm}_depois_mean'] = depois_mean
-                species_data[f'{farm}_variation_abs'] = variation_abs
-                species_data[f'{farm}_variation_rel'] = variation_rel
-                species_data[f'{farm}_present'] = 1 if (antes_mean > 0 or depois_mean > 0) else 0
-            else:
-                # Espécie não está presente nesta fazenda
-                species_data[f'{farm}_antes_mean'] = 0
-                species_data[f'{farm}_depois_mean'] = 0
-                species_data[f'{farm}_variation_abs'] = 0
-                species_data[f'{farm}_variation_rel'] = 0
-                species_data[f'{farm}_present'] = 0
-        
-        # SEMPRE adiciona a espécie, mesmo que não tenha dados em nenhuma fazenda
-        results.append(species_data)
+    # Variação relativa (evita divisão por zero); se antes era 0 e depois > 0,
+    # considera como aparecimento (100% de aumento)
+    variation_abs = depois_mean - antes_mean
+    variation_rel = np.where(depois_mean > 0, 1.0, 0.0)
+    np.divide(variation_abs, antes_mean, out=variation_rel, where=antes_mean > 0)
+    present = ((antes_mean > 0) | (depois_mean > 0)).astype(np.int64)
+    
+    # SEMPRE inclui a espécie, mesmo que não tenha dados em nenhuma fazenda
+    results = df[['Species', 'Phylum', 'Class', 'Order', 'Family', 'Genus']].reset_index(drop=True)
+    columns = {}
+    position = {farm: j for j, farm in enumerate(farms_with_data)}
+    for farm in farms:
+        if farm in position:
+            j = position[farm]
+            columns[f'{farm}_antes_mean'] = antes_mean[:, j]
+            columns[f'{farm}_depois_mean'] = depois_mean[:, j]
+            columns[f'{farm}_variation_abs'] = variation_abs[:, j]
+            columns[f'{farm}_variation_rel'] = variation_rel[:, j]
+            columns[f'{farm}_present'] = present[:, j]
+        else:
+            # Espécie não está presente nesta fazenda
+            for suffix in ['antes_mean', 'depois_mean', 'variation_abs', 'variation_rel', 'present']:
+                columns[f'{farm}_{suffix}'] = np.zeros(n_species, dtype=np.int64)
     
-    print(f"✓ Todas as {len(results)} espécies processadas")
-    return pd.DataFrame(results)
+    results = pd.concat([results, pd.DataFrame(columns)], axis=1)
+    if verbose:
+        print(f"✓ Todas as {len(results)} espécies processadas")
+    return results
 
-def calculate_productivity_weighted_score(variations_df, productivity_factors):
+def _masked_column(values, mask):
+    """
+    Valores onde a máscara é verdadeira e 0 nos demais (coluna inteira se nenhum valor é usado).
+    """
+    if not mask.any():
+        return np.zeros(len(mask), dtype=np.int64)
+    return np.where(mask, values, 0)
+
+def calculate_productivity_weighted_score(variations_df, productivity_factors, verbose=True):
     """
     Calcula o score ponderado pela produtividade para cada espécie.
     """
-    farms = ['F3', 'F4', 'F5', 'F6']
-    results = []
+    farms = list(productivity_factors)
     
-    print(f"Calculando scores para {len(variations_df)} espécies...")
+    if verbose:
+        print(f"Calculando scores para {len(variations_df)} espécies...")
     
-    for idx, (_, row) in enumerate(variations_df.iterrows()):
-        if idx > 0 and idx % 100 == 0:
-            print(f"  Scores calculados para {idx} espécies...")
-            
-        species_scores = []
-        species_weights = []
-        farms_with_data = []
-        
-        for farm in farms:
-            # Verifica se a espécie tem dados nesta fazenda (antes ou depois > 0)
-            if row[f'{farm}_present'] == 1:
-                variation = row[f'{farm}_variation_rel']
-                productivity_factor = productivity_factors[farm]
-                
-                # Score ponderado: variação × fator de produtividade
-                weighted_score = variation * productivity_factor
-                species_scores.append(weighted_score)
-                species_weights.append(productivity_factor)
-                farms_with_data.append(farm)
-        
-        # SEMPRE processa a espécie, mesmo sem dados
-        if species_scores:
-            # Score final: média ponderada dos scores das fazendas onde a espécie está presente
-            final_score = np.average(species_scores, weights=species_weights)
-            
-            # Estatísticas adicionais
-            n_farms_present = len(species_scores)
-            max_score = max(species_scores)
-            min_score = min(species_scores)
-            std_score = np.std(species_scores) if len(species_scores) > 1 else 0
-            
-        else:
-            # Espécie sem dados em nenhuma fazenda
-            final_score = 0
-            n_farms_present = 0
-            max_score = 0
-            min_score = 0
-            std_score = 0
-        
-        result = {
-            'Species': row['Species'],
-            'Phylum': row['Phylum'],
-            'Class': row['Class'],
-            'Order': row['Order'],
-            'Family': row['Family'],
-            'Genus': row['Genus'],
-            'Productivity_Weighted_Score': final_score,
-            'N_Farms_Present': n_farms_present,
-            'Max_Farm_Score': max_score,
-            'Min_Farm_Score': min_score,
-            'Score_Std': std_score,
-            'Farms_With_Data': ', '.join(farms_with_data) if farms_with_data else 'None'
-        }
-        
-        # Adiciona os scores individuais por fazenda (SEMPRE, mesmo que NaN)
-        for farm in farms:
-            if row[f'{farm}_present'] == 1:
-                variation = row[f'{farm}_variation_rel']
-                weighted_score = variation * productivity_factors[farm]
-                result[f'{farm}_Score'] = weighted_score
-                result[f'{farm}_Variation_Rel'] = variation
-                result[f'{farm}_Antes_Mean'] = row[f'{farm}_antes_mean']
-                result[f'{farm}_Depois_Mean'] = row[f'{farm}_depois_mean']
-            else:
-                result[f'{farm}_Score'] = 0  # Era np.nan, agora é 0
-                result[f'{farm}_Variation_Rel'] = 0  # Era np.nan, agora é 0
-                result[f'{farm}_Antes_Mean'] = 0
-                result[f'{farm}_Depois_Mean'] = 0
-        
-        results.append(result)
+    # Matrizes espécies × fazendas
+    present = np.column_stack([variations_df[f'{farm}_present'].to_numpy() == 1 for farm in farms])
+    variation = np.column_stack([variations_df[f'{farm}_variation_rel'].to_numpy(dtype=np.float64) for farm in farms])
+    factors = np.array([productivity_factors[farm] for farm in farms], dtype=np.float64)
     
-    print(f"✓ Scores calculados para todas as {len(results)} espécies")
-    return pd.DataFrame(results)
+    # Score ponderado: variação × fator de produtividade (apenas nas fazendas onde a espécie está presente)
+    scores = variation * factors
+    weights = np.where(present, factors, 0.0)
+    n_farms_present = present.sum(axis=1)
+    has_data = n_farms_present > 0
+    
+    # Score final: média ponderada dos scores das fazendas onde a espécie está presente
+    final_score = np.divide((np.where(present, scores, 0.0) * weights).sum(axis=1), weights.sum(axis=1),
+                            out=np.zeros(len(present)), where=has_data)
+    
+    # Estatísticas adicionais (desvio padrão populacional, como np.std)
+    max_score = np.where(present, scores, -np.inf).max(axis=1, initial=-np.inf)
+    min_score = np.where(present, scores, np.inf).min(axis=1, initial=np.inf)
+    mean_score = np.divide(np.where(present, scores, 0.0).sum(axis=1), n_farms_present,
+                           out=np.zeros(len(present)), where=has_data)
+    deviation = np.where(present, scores - mean_score[:, None], 0.0)
+    std_score = np.sqrt(np.divide((deviation * deviation).sum(axis=1), n_farms_present,
+                                  out=np.zeros(len(present)), where=has_data))
+    
+    # Lista de fazendas com dados, montada uma vez para cada combinação de fazendas presentes
+    combinations, combination_idx = np.unique(present, axis=0, return_inverse=True)
+    labels = np.array([', '.join(farm for farm, used in zip(farms, row) if used) or 'None'
+                       for row in combinations], dtype=object)
+    
+    results = variations_df[['Species', 'Phylum', 'Class', 'Order', 'Family', 'Genus']].reset_index(drop=True)
+    columns = {
+        'Productivity_Weighted_Score': _masked_column(final_score, has_data),
+        'N_Farms_Present': n_farms_present.astype(np.int64),
+        'Max_Farm_Score': _masked_column(max_score, has_data),
+        'Min_Farm_Score': _masked_column(min_score, has_data),
+        'Score_Std': _masked_column(std_score, n_farms_present > 1),
+        'Farms_With_Data': labels[combination_idx.ravel()],
+    }
+    
+    # Adiciona os scores individuais por fazenda (SEMPRE; 0 onde a espécie não está presente)
+    for j, farm in enumerate(farms):
+        columns[f'{farm}_Score'] = _masked_column(scores[:, j], present[:, j])
+        columns[f'{farm}_Variation_Rel'] = _masked_column(variation[:, j], present[:, j])
+        columns[f'{farm}_Antes_Mean'] = _masked_column(variations_df[f'{farm}_antes_mean'].to_numpy(), present[:, j])
+        columns[f'{farm}_Depois_Mean'] = _masked_column(variations_df[f'{farm}_depois_mean'].to_numpy(), present[:, j])
+    
+    results = pd.concat([results, pd.DataFrame(columns)], axis=1)
+    if verbose:
+        print(f"✓ Scores calculados para todas as {len(results)} espécies")
+    return results
+
+def resampling_plan(productivity_factors, n_permutations=1000, n_bootstrap=1000, seed=None):
+    """
+    Sorteia, uma única vez, as permutações dos fatores de produtividade entre fazendas e as contagens
+    da reamostragem bootstrap das fazendas. Com poucas fazendas, usa todas as permutações possíveis.
+    """
+    rng = np.random.default_rng(seed)
+    factors = np.array(list(productivity_factors.values()), dtype=np.float64)
+    n_farms = len(factors)
+    
+    exact = 0 < n_permutations and math.factorial(n_farms) <= n_permutations
+    if exact:
+        permutations = np.array(list(itertools.permutations(range(n_farms))))
+    else:
+        permutations = np.argsort(rng.random((n_permutations, n_farms)), axis=1)
+    bootstrap_counts = rng.multinomial(n_farms, np.full(n_farms, 1 / n_farms), size=n_bootstrap)
+    return {
+        'factors': factors,
+        'permuted_factors': factors[permutations],
+        'exact': exact,
+        'bootstrap_counts': bootstrap_counts.astype(np.float64),
+    }
+
+def _significance_block(variation, present, plan, confidence):
+    factors = plan['factors']
+    weighted_variation = np.where(present, variation, 0.0)
+    
+    # Score ponderado para cada vetor de fatores (linhas): Σ v·f² / Σ f nas fazendas presentes
+    def scores(factor_rows, counts=None):
+        numerator_factors = factor_rows * factor_rows if counts is None else counts * factors * factors
+        denominator_factors = factor_rows if counts is None else counts * factors
+        numerator = weighted_variation @ numerator_factors.T
+        denominator = present @ denominator_factors.T
+        return numerator, denominator
+    
+    numerator, denominator = scores(factors[None, :])
+    observed = np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator > 0)
+    
+    p_value = np.full(len(variation), np.nan)
+    if len(plan['permuted_factors']):
+        numerator, denominator = scores(plan['permuted_factors'])
+        permuted = np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator > 0)
+        extreme = (np.abs(permuted) >= np.abs(observed) - 1e-12).sum(axis=1)
+        n = permuted.shape[1]
+        p_value = extreme / n if plan['exact'] else (extreme + 1) / (n + 1)
+    
+    ci_lower = ci_upper = np.full(len(variation), np.nan)
+    if len(plan['bootstrap_counts']):
+        numerator, denominator = scores(None, plan['bootstrap_counts'])
+        # Reamostragens sem nenhuma fazenda com a espécie não têm score
+        bootstrap = np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=denominator > 0)
+        alpha = (1 - confidence) / 2
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            ci_lower, ci_upper = np.nanquantile(bootstrap, [alpha, 1 - alpha], axis=1)
+    return p_value, ci_lower, ci_upper
+
+def _significance_task(args):
+    return _significance_block(*args)
+
+def calculate_significance(variations_df, productivity_factors, n_permutations=1000, n_bootstrap=1000,
+                           confidence=0.95, seed=None, processes=1, plan=None):
+    """
+    Calcula, para cada espécie, o p-valor do score por permutação dos fatores de produtividade entre as
+    fazendas e o intervalo de confiança bootstrap (reamostragem das fazendas). As reamostragens são
+    feitas em lote, como produtos de matrizes, e podem ser divididas entre processos.
+    """
+    farms = list(productivity_factors)
+    if plan is None:
+        plan = resampling_plan(productivity_factors, n_permutations, n_bootstrap, seed)
+    present = np.column_stack([variations_df[f'{farm}_present'].to_numpy() == 1 for farm in farms]).astype(np.float64)
+    variation = np.column_stack([variations_df[f'{farm}_variation_rel'].to_numpy(dtype=np.float64) for farm in farms])
+    
+    n_resamples = max(len(plan['permuted_factors']), len(plan['bootstrap_counts']), 1)
+    step = max(1, RESAMPLING_BLOCK_ELEMENTS // n_resamples)
+    tasks = [(variation[start:start + step], present[start:start + step], plan, confidence)
+             for start in range(0, len(variation), step)]
+    if processes == 1 or len(tasks) <= 1:
+        parts = [_significance_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            parts = list(executor.map(_significance_task, tasks))
+    
+    columns = ['P_Value', 'CI_Lower', 'CI_Upper']
+    if not parts:
+        return pd.DataFrame(columns=columns, index=variations_df.index, dtype=np.float64)
+    return pd.DataFrame({column: np.concatenate([part[i] for part in parts]) for i, column in enumerate(columns)},
+                        index=variations_df.index)
 
 def interpret_results(results_df):
     """
@@ -196,45 +491,70 @@ def interpret_results(results_df):
     results_df = results_df.copy()
     
     # Classifica o impacto na produtividade
-    def classify_impact(score):
-        if score > 0.1:
-            return "Alto Impacto Positivo"
-        elif score > 0.05:
-            return "Moderado Impacto Positivo"
-        elif score > 0:
-            return "Baixo Impacto Positivo"
-        elif score > -0.05:
-            return "Baixo Impacto Negativo"
-        elif score > -0.1:
-            return "Moderado Impacto Negativo"
-        else:
-            return "Alto Impacto Negativo"
-    
-    results_df['Impact_Classification'] = results_df['Productivity_Weighted_Score'].apply(classify_impact)
+    score = results_df['Productivity_Weighted_Score'].to_numpy()
+    results_df['Impact_Classification'] = np.select(
+        [score > 0.1, score > 0.05, score > 0, score > -0.05, score > -0.1],
+        ["Alto Impacto Positivo", "Moderado Impacto Positivo", "Baixo Impacto Positivo",
+         "Baixo Impacto Negativo", "Moderado Impacto Negativo"],
+        default="Alto Impacto Negativo")
     
     # Ordena por score (mais impactantes primeiro)
     results_df = results_df.sort_values('Productivity_Weighted_Score', ascending=False)
     
     return results_df
 
-def generate_summary_stats(results_df):
+def summarize_results(results_df, top_n=10):
     """
-    Gera estatísticas resumo dos resultados.
+    Resume uma tabela de resultados ordenada por score (contagens e espécies mais impactantes).
+    """
+    score = results_df['Productivity_Weighted_Score']
+    cols = ['Species', 'Productivity_Weighted_Score']
+    return {
+        'total': len(results_df),
+        'positive': int((score > 0).sum()),
+        'negative': int((score < 0).sum()),
+        'zero': int((score == 0).sum()),
+        'top_positive': results_df.loc[score > 0, cols].head(top_n),
+        # Inverte para mostrar os mais negativos primeiro
+        'top_negative': results_df.loc[score < 0, cols].tail(top_n).iloc[::-1],
+    }
+
+def merge_summaries(summary, other, top_n=10):
+    """
+    Combina os resumos de dois blocos de resultados.
+    """
+    if summary is None:
+        return other
+    top_positive = pd.concat([summary['top_positive'], other['top_positive']])
+    top_negative = pd.concat([summary['top_negative'], other['top_negative']])
+    return {
+        'total': summary['total'] + other['total'],
+        'positive': summary['positive'] + other['positive'],
+        'negative': summary['negative'] + other['negative'],
+        'zero': summary['zero'] + other['zero'],
+        'top_positive': top_positive.sort_values('Productivity_Weighted_Score', ascending=False,
+                                                 kind='mergesort').head(top_n),
+        'top_negative': top_negative.sort_values('Productivity_Weighted_Score', kind='mergesort').head(top_n),
+    }
+
+def print_summary(summary):
+    """
+    Imprime o resumo estatístico dos resultados.
     """
     print("\n" + "="*80)
     print("RESUMO ESTATÍSTICO DA ANÁLISE")
     print("="*80)
     
-    total_species = len(results_df)
-    positive_impact = len(results_df[results_df['Productivity_Weighted_Score'] > 0])
-    negative_impact = len(results_df[results_df['Productivity_Weighted_Score'] < 0])
+    total_species = summary['total']
+    positive_impact = summary['positive']
+    negative_impact = summary['negative']
     
     print(f"Total de espécies analisadas: {total_species}")
     print(f"Espécies com impacto positivo: {positive_impact} ({positive_impact/total_species*100:.1f}%)")
     print(f"Espécies com impacto negativo: {negative_impact} ({negative_impact/total_species*100:.1f}%)")
     
     print(f"\nTOP 10 ESPÉCIES COM MAIOR IMPACTO POSITIVO:")
-    top_positive = results_df[results_df['Productivity_Weighted_Score'] > 0].head(10)
+    top_positive = summary['top_positive']
     if len(top_positive) > 0:
         for i, (_, row) in enumerate(top_positive.iterrows(), 1):
             print(f"{i:2d}. {row['Species'][:50]:<50} | Score: {row['Productivity_Weighted_Score']:+.4f}")
@@ -242,62 +562,445 @@ def generate_summary_stats(results_df):
         print("Nenhuma espécie com impacto positivo encontrada.")
     
     print(f"\nTOP 10 ESPÉCIES COM MAIOR IMPACTO NEGATIVO:")
-    negative_species = results_df[results_df['Productivity_Weighted_Score'] < 0]
-    if len(negative_species) > 0:
-        top_negative = negative_species.tail(10).iloc[::-1]  # Inverte para mostrar os mais negativos primeiro
+    top_negative = summary['top_negative']
+    if len(top_negative) > 0:
         for i, (_, row) in enumerate(top_negative.iterrows(), 1):
             print(f"{i:2d}. {row['Species'][:50]:<50} | Score: {row['Productivity_Weighted_Score']:+.4f}")
     else:
         print("Nenhuma espécie com impacto negativo encontrada.")
     
     print(f"\nESPÉCIES SEM DADOS (Score = 0):")
-    zero_species = results_df[results_df['Productivity_Weighted_Score'] == 0]
-    print(f"Total: {len(zero_species)} espécies")
+    print(f"Total: {summary['zero']} espécies")
+
+def generate_summary_stats(results_df):
+    """
+    Gera estatísticas resumo dos resultados.
+    """
+    print_summary(summarize_results(results_df))
+
+def _merge_runs(run_files, output_file, key):
+    handles = [open(run_file, newline='', encoding='utf-8') for run_file in run_files]
+    try:
+        readers = [csv.reader(handle) for handle in handles]
+        header = [next(reader) for reader in readers][0]
+        key_idx = header.index(key)
+        with open(output_file, 'w', newline='', encoding='utf-8') as out:
+            writer = csv.writer(out, lineterminator='\n')
+            writer.writerow(header)
+            writer.writerows(heapq.merge(*readers, key=lambda row: float(row[key_idx]), reverse=True))
+    finally:
+        for handle in handles:
+            handle.close()
+
+def merge_sorted_runs(run_files, output_file, key='Productivity_Weighted_Score', fan_in=MERGE_FAN_IN):
+    """
+    Intercala arquivos CSV já ordenados por score (decrescente) em um único arquivo ordenado,
+    mantendo apenas uma linha de cada arquivo em memória e no máximo `fan_in` arquivos abertos.
+    """
+    run_files = list(run_files)
+    # Os arquivos intermediários ficam na pasta dos blocos
+    tmp_dir = os.path.dirname(os.path.abspath(run_files[0])) if run_files else None
+    level = 0
+    # Passadas intermediárias: grupos consecutivos de arquivos, para que empates mantenham a ordem dos blocos
+    while len(run_files) > fan_in:
+        level += 1
+        merged = []
+        for n, start in enumerate(range(0, len(run_files), fan_in)):
+            group = run_files[start:start + fan_in]
+            merged_file = os.path.join(tmp_dir, f'intercalado_{level}_{n:06d}.csv')
+            _merge_runs(group, merged_file, key)
+            if level > 1:
+                for run_file in group:
+                    os.remove(run_file)
+            merged.append(merged_file)
+        run_files = merged
+    _merge_runs(run_files, output_file, key)
+    if level:
+        for run_file in run_files:
+            os.remove(run_file)
 
-def main():
+def print_progress(stage, done, total, rows_per_second):
+    """
+    Callback de progresso padrão: uma linha por atualização.
+    """
+    total_text = f"/{total}" if total else ""
+    print(f"  {stage}: {done}{total_text} espécies ({rows_per_second:,.0f} espécies/s)")
+
+def _current_rss_mb():
+    # Memória residente atual (Linux); None onde /proc não existe
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if os.uname().sysname == 'Darwin' else rss / 2**10
+
+class RunMonitor:
+    """
+    Instrumentação da análise: tempo, espécies/s e memória de cada etapa, progresso com intervalo
+    mínimo entre mensagens e, opcionalmente, perfil cProfile e memória via tracemalloc.
+    Memória por etapa: `rss_increase_mb` é o maior aumento da memória residente entre o início e o fim
+    de uma chamada da etapa; `process_peak_rss_mb` é o pico do processo até o fim da etapa (acumulado,
+    não da etapa); `traced_peak_mb` (com trace_memory) é o pico alocado durante a etapa.
+    """
+    def __init__(self, progress=print_progress, interval=PROGRESS_INTERVAL, profile=False, trace_memory=False):
+        self.progress = progress
+        self.interval = interval
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.info = {}
+        self._started = None
+        self._last_update = {}
+    
+    def start(self, **info):
+        self.info.update(info, started=datetime.now().isoformat(timespec='seconds'))
+        self._started = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profiler:
+            self.profiler.enable()
+    
+    def finish(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.trace_memory:
+            tracemalloc.stop()
+        self.info['total_seconds'] = time.perf_counter() - self._started
+    
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """
+        Mede uma etapa. Etapas repetidas (uma por bloco no modo em blocos) são acumuladas.
+        """
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        rss_start = _current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start, rows, rss_start)
+    
+    def count(self, name, rows):
+        """
+        Acrescenta espécies a uma etapa já medida (quando só se sabe o total ao final dela).
+        """
+        self.stages[name]['rows'] = (self.stages[name]['rows'] or 0) + rows
+    
+    def timed_iter(self, name, iterable):
+        """
+        Mede como etapa `name` o tempo gasto para produzir cada item (ex.: leitura dos blocos).
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            self.count(name, len(item))
+            yield item
+    
+    def update(self, stage, done, total=None):
+        """
+        Informa o progresso de uma etapa; o callback é chamado no máximo uma vez a cada `interval`
+        segundos, além da conclusão (done == total).
+        """
+        if self.progress is None:
+            return
+        now = time.perf_counter()
+        first, last = self._last_update.get(stage, (now, None))
+        if last is not None and now - last < self.interval and (total is None or done < total):
+            return
+        self._last_update[stage] = (first, now)
+        elapsed = now - (self._started or first)
+        self.progress(stage, done, total, done / elapsed if elapsed > 0 else 0.0)
+    
+    def _record(self, name, seconds, rows, rss_start=None):
+        entry = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'rows': None, 'rss_increase_mb': None,
+                                             'process_peak_rss_mb': None, 'traced_peak_mb': None})
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        if rows is not None:
+            entry['rows'] = (entry['rows'] or 0) + rows
+        rss_end = _current_rss_mb()
+        if rss_start is not None and rss_end is not None:
+            entry['rss_increase_mb'] = max(entry['rss_increase_mb'] or 0.0, rss_end - rss_start)
+        entry['process_peak_rss_mb'] = _max_rss_mb()
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            entry['traced_peak_mb'] = max(entry['traced_peak_mb'] or 0.0, peak)
+    
+    def report(self, top=25):
+        """
+        Relatório da execução em um dicionário serializável em JSON.
+        """
+        stages = []
+        for name, entry in self.stages.items():
+            rows_per_second = entry['rows'] / entry['seconds'] if entry['rows'] and entry['seconds'] > 0 else None
+            stages.append({'stage': name, **entry, 'rows_per_second': rows_per_second})
+        report = {**self.info, 'stages': stages}
+        if self.profiler:
+            import pstats
+            stats = pstats.Stats(self.profiler).stats
+            rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+            report['profile'] = [{'function': f'{file}:{line}({function})', 'calls': calls,
+                                  'total_seconds': total, 'cumulative_seconds': cumulative}
+                                 for (file, line, function), (_, calls, total, cumulative, _) in rows]
+        return report
+    
+    def save_report(self, report_file):
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        if self.profiler:
+            # Perfil completo, para pstats/snakeviz
+            self.profiler.dump_stats(os.path.splitext(report_file)[0] + '.prof')
+
+def _significance_plan(productivity_factors, significance):
+    if not significance:
+        return None
+    return resampling_plan(productivity_factors, significance.get('n_permutations', 1000),
+                           significance.get('n_bootstrap', 1000), significance.get('seed'))
+
+def _significance_options(significance):
+    return {key: significance[key] for key in ('confidence', 'processes') if key in significance}
+
+def run_streaming_analysis(input_file, output_file, productivity_factors, chunksize=DEFAULT_CHUNKSIZE,
+                           model=DEFAULT_MODEL, significance=None, monitor=None):
+    """
+    Processa a tabela de abundância em blocos de espécies, gravando cada bloco já pontuado em disco.
+    Retorna o resumo estatístico; apenas as espécies do resumo ficam em memória.
+    """
+    monitor = monitor or RunMonitor()
+    summary = None
+    run_files = []
+    # Blocos intermediários ficam ao lado do arquivo de saída
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as tmp_dir:
+        farms = list(productivity_factors)
+        # O mesmo sorteio de reamostragens vale para todos os blocos
+        plan = _significance_plan(productivity_factors, significance)
+        chunks = monitor.timed_iter('load', iter_abundance_chunks(input_file, chunksize, farms, model))
+        for n, chunk in enumerate(chunks):
+            rows = len(chunk)
+            with monitor.stage('variation', rows):
+                variations_df = calculate_species_variation(chunk, verbose=False, farms=farms, model=model)
+            with monitor.stage('scoring', rows):
+                results_df = calculate_productivity_weighted_score(variations_df, productivity_factors, verbose=False)
+            if plan is not None:
+                with monitor.stage('significance', rows):
+                    results_df = results_df.join(calculate_significance(variations_df, productivity_factors,
+                                                                        plan=plan, **_significance_options(significance)))
+            with monitor.stage('interpretation', rows):
+                results_df = interpret_results(results_df)
+            
+            with monitor.stage('write', rows):
+                run_file = os.path.join(tmp_dir, f'bloco_{n:06d}.csv')
+                results_df.to_csv(run_file, index=False)
+                run_files.append(run_file)
+            with monitor.stage('summary', rows):
+                summary = merge_summaries(summary, summarize_results(results_df))
+            monitor.update('blocos', summary['total'])
+        if summary:
+            monitor.update('blocos', summary['total'], summary['total'])
+        
+        with monitor.stage('merge', summary['total'] if summary else 0):
+            if run_files and _extension(output_file) in COLUMNAR_EXTENSIONS:
+                merged_file = os.path.join(tmp_dir, 'resultados.csv')
+                merge_sorted_runs(run_files, merged_file)
+                convert_csv_results(merged_file, output_file, chunksize)
+            elif run_files:
+                merge_sorted_runs(run_files, output_file)
+    return summary
+
+def run_analysis(input_file='abundance_data.csv', output_file='productivity_weighted_analysis.csv', chunksize=None,
+                 config_file=None, significance=None, monitor=None, report_file=None, cache_dir=None,
+                 cache_size=DEFAULT_CACHE_SIZE):
+    """
+    Executa a análise completa e retorna a tabela de resultados (None se o arquivo não existir).
+    Com `chunksize`, lê a tabela em blocos e retorna apenas o resumo estatístico. `config_file` é um
+    JSON com as produtividades das fazendas e os padrões das colunas (ver DEFAULT_MODEL).
+    `significance` ativa os testes de significância, com as opções de calculate_significance
+    (n_permutations, n_bootstrap, confidence, seed, processes). `monitor` (RunMonitor) recebe os tempos
+    e a memória de cada etapa; com `report_file`, o relatório da execução é salvo em JSON.
+    Com `cache_dir` (apenas sem `chunksize`), a tabela de variações e a de resultados ficam guardadas
+    nessa pasta, pelo conteúdo da entrada e pelos parâmetros, e são reaproveitadas nas próximas execuções.
+    """
     print("Iniciando análise de produtividade ponderada por abundância bacteriana...")
     print("="*80)
     
-    # 1. Carrega os dados
-    input_file = 'abundance_data.csv'
+    if not os.path.exists(input_file):
+        print(f"❌ Erro: Arquivo {input_file} não encontrado!")
+        return None
+    
+    monitor = monitor or RunMonitor()
+    monitor.start(input_file=input_file, output_file=output_file, mode='blocos' if chunksize else 'memória',
+                  chunksize=chunksize)
     try:
-        df = load_abundance_data(input_file)
+        model = load_farm_model(config_file)
+        discovered = map_farm_columns(read_columns(input_file), model)
+        without_productivity = [farm for farm in discovered if farm not in model['productivity']]
+        if without_productivity:
+            print(f"⚠ Fazendas sem produtividade definida (ignoradas): {', '.join(without_productivity)}")
+        
+        if chunksize:
+            print(f"\nCalculando fatores de produtividade:")
+            with monitor.stage('factors'):
+                productivity_factors, mean_prod = calculate_productivity_factors(model['productivity'])
+            print(f"Produtividade média: {mean_prod:.0f} kg/ha")
+        
+            print(f"\nProcessando {input_file} em blocos de {chunksize} espécies...")
+            summary = run_streaming_analysis(input_file, output_file, productivity_factors, chunksize, model,
+                                             significance, monitor)
+            if summary is None or summary['total'] == 0:
+                print(f"❌ Erro: Arquivo {input_file} não contém espécies!")
+                return None
+            print(f"✓ Resultados COMPLETOS salvos em: {output_file}")
+            print(f"✓ Todas as {summary['total']} espécies incluídas no arquivo de saída")
+            with monitor.stage('summary'):
+                print_summary(summary)
+            result = summary
+        else:
+            result = _run_in_memory(input_file, output_file, model, significance, monitor, cache_dir, cache_size)
+    finally:
+        # Desliga o cProfile e o tracemalloc mesmo quando a análise termina antes (ou com erro)
+        monitor.finish()
+    if report_file:
+        monitor.save_report(report_file)
+        print(f"✓ Relatório de execução salvo em: {report_file}")
+    
+    print(f"\n{'='*80}")
+    print("ANÁLISE CONCLUÍDA!")
+    print(f"Arquivo de saída: {output_file}")
+    print("="*80)
+    return result
+
+def _run_in_memory(input_file, output_file, model, significance=None, monitor=None, cache_dir=None,
+                   cache_size=DEFAULT_CACHE_SIZE):
+    monitor = monitor or RunMonitor()
+    farms = list(model['productivity'])
+    
+    # As variações dependem só da tabela e das colunas das fazendas; os resultados, também das produtividades.
+    # Sem semente, os testes de significância são aleatórios e os resultados não vão para o cache.
+    variations_df = results_df = results_key = None
+    if cache_dir:
+        with monitor.stage('cache'):
+            variations_key = cache_key('variations', file_digest(input_file), farms,
+                                       model['before_pattern'], model['after_pattern'])
+            variations_df = cache_get(cache_dir, variations_key)
+            if not significance or significance.get('seed') is not None:
+                options = {key: value for key, value in (significance or {}).items() if key != 'processes'}
+                results_key = cache_key('results', variations_key, model['productivity'], options)
+                results_df = cache_get(cache_dir, results_key)
+    
+    # 1. Carrega os dados
+    if variations_df is None:
+        with monitor.stage('load'):
+            df = load_abundance_data(input_file, farms, model)
+        monitor.count('load', len(df))
         print(f"✓ Dados carregados: {len(df)} espécies, {len(df.columns)-6} amostras")
-    except FileNotFoundError:
-        print(f"❌ Erro: Arquivo {input_file} não encontrado!")
-        return
     
     # 2. Calcula fatores de produtividade
     print(f"\nCalculando fatores de produtividade:")
-    productivity_factors, mean_prod = calculate_productivity_factors()
+    with monitor.stage('factors'):
+        productivity_factors, mean_prod = calculate_productivity_factors(model['productivity'])
     print(f"Produtividade média: {mean_prod:.0f} kg/ha")
     
     # 3. Calcula variações das espécies
-    print(f"\nCalculando variações de abundância por espécie e fazenda...")
-    variations_df = calculate_species_variation(df)
-    print(f"✓ Variações calculadas para {len(variations_df)} espécies")
-    
-    # 4. Calcula scores ponderados
-    print(f"\nCalculando scores ponderados pela produtividade...")
-    results_df = calculate_productivity_weighted_score(variations_df, productivity_factors)
-    print(f"✓ Scores calculados para {len(results_df)} espécies")
+    if variations_df is None:
+        print(f"\nCalculando variações de abundância por espécie e fazenda...")
+        with monitor.stage('variation', len(df)):
+            variations_df = calculate_species_variation(df, verbose=False, farms=farms, model=model)
+        print(f"✓ Variações calculadas para {len(variations_df)} espécies")
+        if cache_dir:
+            cache_put(cache_dir, variations_key, variations_df, cache_size)
+    else:
+        print(f"\n✓ Variações de {len(variations_df)} espécies reaproveitadas do cache")
+    n_species = len(variations_df)
     
-    # 5. Interpreta resultados
-    results_df = interpret_results(results_df)
+    if results_df is None:
+        # 4. Calcula scores ponderados
+        print(f"\nCalculando scores ponderados pela produtividade...")
+        with monitor.stage('scoring', n_species):
+            results_df = calculate_productivity_weighted_score(variations_df, productivity_factors, verbose=False)
+        print(f"✓ Scores calculados para {len(results_df)} espécies")
+        
+        # 4b. Testes de significância (opcional)
+        if significance:
+            print(f"\nCalculando p-valores por permutação e intervalos bootstrap...")
+            with monitor.stage('significance', n_species):
+                plan = _significance_plan(productivity_factors, significance)
+                results_df = results_df.join(calculate_significance(variations_df, productivity_factors, plan=plan,
+                                                                    **_significance_options(significance)))
+            print(f"✓ {len(plan['permuted_factors'])} permutações"
+                  f"{' (todas as possíveis)' if plan['exact'] else ''}, {len(plan['bootstrap_counts'])} reamostragens bootstrap")
+        
+        # 5. Interpreta resultados
+        with monitor.stage('interpretation', n_species):
+            results_df = interpret_results(results_df)
+        if results_key:
+            cache_put(cache_dir, results_key, results_df, cache_size)
+    else:
+        print(f"✓ Scores de {len(results_df)} espécies reaproveitados do cache")
     
     # 6. Salva resultados COMPLETOS
-    output_file = 'productivity_weighted_analysis.csv'
-    results_df.to_csv(output_file, index=False)
+    with monitor.stage('write', n_species):
+        save_results(results_df, output_file)
     print(f"✓ Resultados COMPLETOS salvos em: {output_file}")
-    print(f"✓ Todas as {len(results_df)} espécies incluídas no arquivo CSV")
+    print(f"✓ Todas as {len(results_df)} espécies incluídas no arquivo de saída")
     
     # 7. Gera resumo estatístico (apenas para visualização)
-    generate_summary_stats(results_df)
-    
-    print(f"\n{'='*80}")
-    print("ANÁLISE CONCLUÍDA!")
-    print(f"Arquivo de saída: {output_file}")
-    print("="*80)
+    with monitor.stage('summary', n_species):
+        generate_summary_stats(results_df)
+    return results_df
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Produtiv: impacto de táxons microbianos na produtividade.")
+    parser.add_argument('-i', '--input', default='abundance_data.csv',
+                        help="Tabela de abundância: .csv, .parquet ou .feather/.arrow (padrão: %(default)s)")
+    parser.add_argument('-o', '--output', default='productivity_weighted_analysis.csv',
+                        help="Arquivo de resultados: .csv, .parquet ou .feather/.arrow (padrão: %(default)s)")
+    parser.add_argument('--chunksize', type=int, nargs='?', const=DEFAULT_CHUNKSIZE,
+                        help=f"Lê a tabela em blocos de N espécies, para tabelas maiores que a memória "
+                             f"(padrão com a opção sem valor: {DEFAULT_CHUNKSIZE})")
+    parser.add_argument('-c', '--config',
+                        help="JSON com as produtividades das fazendas e os padrões das colunas antes/depois")
+    parser.add_argument('--permutations', type=int, default=0,
+                        help="Número de permutações para os p-valores; 0 desativa os testes de significância")
+    parser.add_argument('--bootstrap', type=int, default=1000,
+                        help="Número de reamostragens bootstrap para os intervalos de confiança (padrão: %(default)s)")
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help="Nível de confiança dos intervalos bootstrap (padrão: %(default)s)")
+    parser.add_argument('--seed', type=int, help="Semente do gerador aleatório, para resultados reproduzíveis")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Processos para os testes de significância (padrão: %(default)s)")
+    parser.add_argument('--report', help="Salva em JSON o relatório da execução: tempo, espécies/s e memória por etapa")
+    parser.add_argument('--profile', action='store_true',
+                        help="Inclui no relatório as funções mais lentas (cProfile) e salva o perfil completo em .prof")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Mede o pico de memória alocada em cada etapa com tracemalloc (mais lento)")
+    parser.add_argument('--cache', nargs='?', const='.produtiv_cache',
+                        help="Pasta do cache de variações e resultados, reaproveitados quando a entrada e os "
+                             "parâmetros se repetem (padrão com a opção sem valor: .produtiv_cache)")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // 2**20,
+                        help="Tamanho máximo do cache em MB (padrão: %(default)s)")
+    args = parser.parse_args(argv)
+
+    significance = None
+    if args.permutations:
+        significance = {'n_permutations': args.permutations, 'n_bootstrap': args.bootstrap,
+                        'confidence': args.confidence, 'seed': args.seed, 'processes': args.processes}
+
+    warnings.filterwarnings('ignore')
+    monitor = RunMonitor(profile=args.profile, trace_memory=args.trace_memory)
+    run_analysis(args.input, args.output, args.chunksize, args.config, significance, monitor, args.report,
+                 args.cache, args.cache_size * 2**20)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
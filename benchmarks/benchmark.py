@@ -0,0 +1,270 @@
+"""
+Benchmarks de CertiBase, CaCrEst e Produtiv em várias escalas de dados sintéticos.
+
+Mede o tempo de cada etapa (leitura, cálculo, gravação) e o pico de memória alocada, e grava os
+resultados em JSON para comparar versões:
+
+    python benchmarks/benchmark.py --scale small medium -o antes.json
+    python benchmarks/benchmark.py --scale small medium -o depois.json --compare antes.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import generators
+import tools
+
+# Parâmetros dos dados sintéticos em cada escala
+SCALES = {
+    'certibase': {
+        'small': {'n_accessions': 1000, 'n_loci': 30, 'n_queries': 50},
+        'medium': {'n_accessions': 20000, 'n_loci': 30, 'n_queries': 200},
+        'large': {'n_accessions': 200000, 'n_loci': 30, 'n_queries': 500},
+    },
+    'cacrest': {
+        'small': {'n_trees': 1000},
+        'medium': {'n_trees': 20000},
+        'large': {'n_trees': 200000},
+    },
+    'produtiv': {
+        'small': {'n_species': 2000, 'n_farms': 4, 'n_replicates': 3},
+        'medium': {'n_species': 50000, 'n_farms': 8, 'n_replicates': 3},
+        'large': {'n_species': 300000, 'n_farms': 20, 'n_replicates': 3},
+    },
+}
+
+
+def _data_file(data_dir, tool, scale, params, name):
+    key = '_'.join(f'{k}{v}' for k, v in sorted(params.items()))
+    return os.path.join(data_dir, f'{tool}_{scale}_{key}_{name}')
+
+
+# Cada preparação gera (ou reaproveita) os arquivos de entrada e devolve as etapas na ordem de execução.
+# Uma etapa é (nome, função, nº de linhas processadas); cada função recebe o estado das anteriores.
+
+def certibase_stages(tool, params, data_dir, out_dir, scale):
+    database = _data_file(data_dir, 'certibase', scale, params, 'banco.xlsx')
+    queries = _data_file(data_dir, 'certibase', scale, params, 'consultas.xlsx')
+    if not os.path.exists(database):
+        generators.allele_database(database, params['n_accessions'], params['n_loci'])
+    if not os.path.exists(queries):
+        generators.allele_queries(queries, database, params['n_queries'])
+    compiled = os.path.join(out_dir, 'banco.certibase')
+    output = os.path.join(out_dir, 'resultados.csv')
+
+    def compile_(state):
+        tool.compilar_banco(database, compiled)
+
+    def load(state):
+        state['banco'] = tool.carregar_banco(compiled)
+        state['query'] = tool.ler_planilha(queries)
+
+    def compute(state):
+        nomes, alelos, validos = state['banco']
+        state['tabela'] = tool.comparar_lote(state['query'], nomes, alelos, validos)
+
+    def write(state):
+        tool.exportar_resultados(state['tabela'], output)
+
+    n = params['n_accessions']
+    return [('compile', compile_, n), ('load', load, n),
+            ('compute', compute, n * params['n_queries']), ('write', write, None)]
+
+
+def cacrest_stages(tool, params, data_dir, out_dir, scale):
+    inventory = _data_file(data_dir, 'cacrest', scale, params, 'inventario.xlsx')
+    if not os.path.exists(inventory):
+        generators.tree_inventory(inventory, params['n_trees'])
+    output = os.path.join(out_dir, 'inventario_Calculado.xlsx')
+    graph = os.path.join(out_dir, 'inventario_Graph.png')
+
+    def load(state):
+        state['df'] = pd.read_excel(inventory)
+
+    def compute(state):
+        df = state['df']
+        state['trees'] = tool.calculate_inventory(df.iloc[:, 0], tool.select_models(df))
+        state['output'] = tool.add_mean_row(state['trees'])
+
+    def write(state):
+        tool.write_styled_excel(state['output'], output)
+
+    def chart(state):
+        tool.render_histogram(*tool.diameter_histogram(state['trees']['Diâmetro']), graph)
+
+    n = params['n_trees']
+    return [('load', load, n), ('compute', compute, n), ('write', write, n), ('chart', chart, n)]
+
+
+def produtiv_stages(tool, params, data_dir, out_dir, scale):
+    abundance = _data_file(data_dir, 'produtiv', scale, params, 'abundance.csv')
+    productivity_file = abundance + '.json'
+    if not os.path.exists(abundance) or not os.path.exists(productivity_file):
+        _, productivity = generators.abundance_table(abundance, params['n_species'], params['n_farms'],
+                                                     params['n_replicates'])
+        with open(productivity_file, 'w', encoding='utf-8') as f:
+            json.dump(productivity, f)
+    with open(productivity_file, encoding='utf-8') as f:
+        productivity = json.load(f)
+    model = dict(tool.DEFAULT_MODEL, productivity=productivity)
+    farms = list(productivity)
+    output = os.path.join(out_dir, 'productivity_weighted_analysis.csv')
+
+    def load(state):
+        state['df'] = tool.load_abundance_data(abundance, farms, model)
+
+    def factors(state):
+        state['factors'], _ = tool.calculate_productivity_factors(productivity)
+
+    def variation(state):
+        state['variations'] = tool.calculate_species_variation(state['df'], False, farms, model)
+
+    def scoring(state):
+        state['results'] = tool.calculate_productivity_weighted_score(state['variations'], state['factors'], False)
+
+    def interpretation(state):
+        state['results'] = tool.interpret_results(state['results'])
+
+    def write(state):
+        tool.save_results(state['results'], output)
+
+    n = params['n_species']
+    return [('load', load, n), ('factors', factors, None), ('variation', variation, n),
+            ('scoring', scoring, n), ('interpretation', interpretation, n), ('write', write, n)]
+
+
+STAGES = {'certibase': certibase_stages, 'cacrest': cacrest_stages, 'produtiv': produtiv_stages}
+
+
+def run_stages(stages, trace_memory=False):
+    """Executa as etapas em ordem; retorna {etapa: (segundos, pico de MB ou None)}."""
+    state = {}
+    timings = {}
+    for name, function, _ in stages:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # as mensagens das ferramentas não entram no relatório
+            function(state)
+        seconds = time.perf_counter() - start
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        timings[name] = (seconds, peak)
+    return timings
+
+
+def benchmark(tool_name, scale, params, data_dir, repeat=3, memory=True):
+    tool = tools.load_tool(tool_name, prefix='bench')
+    results = []
+    runs = []
+    for i in range(repeat + memory):
+        with tempfile.TemporaryDirectory() as out_dir:
+            stages = STAGES[tool_name](tool, params, data_dir, out_dir, scale)
+            # A execução com tracemalloc é mais lenta: mede só a memória, não entra nos tempos
+            runs.append(run_stages(stages, trace_memory=memory and i == repeat))
+    timed = runs[:repeat]
+    for name, _, rows in stages:
+        seconds = [run[name][0] for run in timed]
+        best = min(seconds) if seconds else None
+        results.append({
+            'tool': tool_name,
+            'scale': scale,
+            'params': params,
+            'stage': name,
+            'seconds_min': best,
+            'seconds_median': statistics.median(seconds) if seconds else None,
+            'rows': rows,
+            'rows_per_second': rows / best if rows and best else None,
+            'peak_mb': runs[-1][name][1] if memory else None,
+        })
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def compare(results, baseline):
+    """Tabela com a razão entre os tempos atuais e os do arquivo de referência (> 1 = mais lento)."""
+    key = lambda r: (r['tool'], r['scale'], r['stage'])
+    before = {key(r): r for r in baseline['results']}
+    rows = []
+    for r in results:
+        old = before.get(key(r))
+        if old and old['seconds_min'] and r['seconds_min'] is not None:
+            rows.append({'tool': r['tool'], 'scale': r['scale'], 'stage': r['stage'],
+                         'before_s': old['seconds_min'], 'after_s': r['seconds_min'],
+                         'ratio': r['seconds_min'] / old['seconds_min']})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de CertiBase, CaCrEst e Produtiv.")
+    parser.add_argument('--tool', nargs='+', choices=list(SCALES), default=list(SCALES),
+                        help="Ferramentas medidas (padrão: todas)")
+    parser.add_argument('--scale', nargs='+', choices=['small', 'medium', 'large'], default=['small'],
+                        help="Escalas dos dados sintéticos (padrão: small)")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetições cronometradas (padrão: %(default)s)")
+    parser.add_argument('--no-memory', action='store_true', help="Não faz a execução extra que mede a memória")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'lfdgv-benchmarks'),
+                        help="Pasta dos dados sintéticos, reaproveitados entre execuções (padrão: %(default)s)")
+    parser.add_argument('-o', '--output', help="Arquivo JSON dos resultados")
+    parser.add_argument('--compare', help="JSON de uma execução anterior para comparar os tempos")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for tool_name in args.tool:
+        for scale in args.scale:
+            print(f"{tool_name} [{scale}]...", flush=True)
+            results.extend(benchmark(tool_name, scale, SCALES[tool_name][scale], args.data_dir, args.repeat,
+                                     not args.no_memory))
+
+    table = pd.DataFrame(results).drop(columns='params')
+    print(table.to_string(index=False, float_format=lambda x: f'{x:.4g}'))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Resultados salvos em: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(compare(results, baseline).to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Geradores de dados sintéticos para os benchmarks de CertiBase, CaCrEst e Produtiv.
+
+Cada gerador grava um arquivo no mesmo formato das planilhas reais de cada ferramenta e é
+determinístico para uma mesma semente, para que execuções em versões diferentes usem os mesmos dados.
+"""
+import numpy as np
+import pandas as pd
+
+TAXONOMY_COLS = ['Phylum', 'Class', 'Order', 'Family', 'Genus', 'Species']
+
+
+def _write_sheet(rows, path, header=None):
+    # Planilhas grandes são gravadas no modo write-only do openpyxl, bem mais rápido que o to_excel
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    if header is not None:
+        ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def allele_database(path, n_accessions, n_loci=30, missing=0.05, seed=0):
+    """
+    Banco de alelos SSR no formato do "Banco de Dados.xlsx" do CertiBase: uma linha de título, a linha
+    com os nomes dos locos e uma linha por acesso (nome na primeira coluna). Tamanhos de alelo entre
+    80 e 300 pb; uma fração `missing` dos alelos fica vazia.
+    """
+    rng = np.random.default_rng(seed)
+    alleles = rng.integers(80, 300, size=(n_accessions, n_loci)).astype(object)
+    alleles[rng.random(alleles.shape) < missing] = None
+    rows = [[None, 'Banco sintético'], [None] + [f'SSR-{j + 1}' for j in range(n_loci)]]
+    rows += ([f'Acesso_{i}'] + alleles[i].tolist() for i in range(n_accessions))
+    return _write_sheet(rows, path)
+
+
+def allele_queries(path, database_path, n_queries, mutation=0.1, seed=1):
+    """
+    Arquivo de consultas para o CertiBase: acessos sorteados do banco com uma fração `mutation` dos
+    alelos deslocada alguns pb, para que cada consulta tenha um par próximo mas não idêntico.
+    """
+    rng = np.random.default_rng(seed)
+    db = pd.read_excel(database_path, header=None)
+    loci = db.iloc[1:2]
+    accessions = db.iloc[2:]
+    sample = accessions.iloc[rng.integers(0, len(accessions), n_queries)].copy()
+    values = sample.iloc[:, 1:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    shift = rng.integers(-4, 5, size=values.shape) * (rng.random(values.shape) < mutation)
+    sample.iloc[:, 1:] = values + shift
+    sample.iloc[:, 0] = [f'Consulta_{i}' for i in range(n_queries)]
+    rows = [[None if pd.isna(v) else v for v in row] for row in pd.concat([loci, sample]).itertuples(index=False)]
+    return _write_sheet(rows, path)
+
+
+def tree_inventory(path, n_trees, species=None, seed=0):
+    """
+    Inventário de campo do CaCrEst: circunferência à altura do peito (CAP, cm) na primeira coluna e,
+    opcionalmente, a coluna "Espécie" sorteada da lista `species`.
+    """
+    rng = np.random.default_rng(seed)
+    cap = np.round(rng.lognormal(np.log(90), 0.3, n_trees), 1)
+    header = ['CAP']
+    columns = [cap.tolist()]
+    if species:
+        header.append('Espécie')
+        columns.append(rng.choice(species, n_trees).tolist())
+    return _write_sheet(zip(*columns), path, header)
+
+
+def abundance_table(path, n_species, n_farms=4, n_replicates=3, zeros=0.4, missing=0.05, seed=0):
+    """
+    Tabela de abundância do Produtiv: taxonomia e, para cada fazenda F1..Fn, as colunas de réplicas
+    antes (FnA1..) e depois (FnB1..). Retorna também as produtividades (kg/ha) sintéticas das fazendas,
+    no formato da chave "productivity" do modelo de fazendas.
+    """
+    rng = np.random.default_rng(seed)
+    data = {col: [f'{col}_{i % 7}' for i in range(n_species)] for col in TAXONOMY_COLS[:-1]}
+    data['Species'] = [f'Sp_{i}' for i in range(n_species)]
+    for farm in range(1, n_farms + 1):
+        for stage in 'AB':
+            for replicate in range(1, n_replicates + 1):
+                values = rng.exponential(0.01, n_species)
+                values[rng.random(n_species) < zeros] = 0
+                values[rng.random(n_species) < missing] = np.nan
+                data[f'F{farm}{stage}{replicate}'] = values
+    df = pd.DataFrame(data)
+    if path.lower().endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    productivity = {f'F{farm}': float(rng.integers(3000, 12000)) for farm in range(1, n_farms + 1)}
+    return path, productivity
@@ -0,0 +1,393 @@
+"""
+Servidor local de tarefas para CertiBase, CaCrEst e Produtiv.
+
+Mantém em memória os bancos compilados do CertiBase, as planilhas de inventário e as tabelas de
+variações do Produtiv já lidas, recebe tarefas por HTTP (JSON), executa os cálculos em um conjunto
+limitado de threads e devolve os resultados em NDJSON, em blocos, à medida que são enviados:
+
+    python server/lfdgv_server.py --port 8765
+
+    POST /jobs               {"tool": "certibase", "database": "...", "queries": "...", "k": 3}
+    GET  /jobs/<id>          situação da tarefa
+    GET  /jobs/<id>/results  resultados (espera a tarefa terminar)
+    POST /run                envia a tarefa e já devolve os resultados
+    GET  /health
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from tools import load_tool
+
+# Linhas de resultado por bloco enviado e tamanho máximo do corpo de uma requisição
+ROWS_PER_CHUNK = 1000
+MAX_BODY = 16 * 2**20
+
+
+def file_signature(*paths):
+    """Tamanho e data de modificação dos arquivos: muda quando algum deles é alterado."""
+    return tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths if os.path.exists(path))
+
+
+class WarmCache:
+    """
+    Dados já carregados (LRU), por chave; uma entrada é recarregada quando a assinatura dos
+    arquivos de origem muda. Cargas simultâneas da mesma chave são feitas uma única vez.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key, signature, loader):
+        with self.key_lock(key):
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry and entry[0] == signature:
+                    self.entries.move_to_end(key)
+                    return entry[1]
+            value = loader()
+            with self.lock:
+                self.entries[key] = (signature, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            return value
+
+    def keys(self):
+        with self.lock:
+            return [list(key) if isinstance(key, tuple) else key for key in self.entries]
+
+
+# Tarefas de cada ferramenta: recebem os parâmetros em JSON e devolvem um DataFrame
+
+def _store_signature(tool, store):
+    generation = tool.pasta_da_geracao(store)
+    files = [os.path.join(store, 'atual.json'), os.path.join(generation, 'meta.json'),
+             os.path.join(generation, 'removidos.npy')]
+    segments = os.path.join(generation, 'segmentos')
+    if os.path.isdir(segments):
+        files += [os.path.join(segments, name, 'meta.json') for name in sorted(os.listdir(segments))]
+    return file_signature(*files)
+
+
+def certibase_job(tools, warm, params):
+    tool = tools['certibase']
+    database = params['database']
+    store = database if os.path.isdir(database) else os.path.splitext(database)[0] + tool.EXTENSAO_BANCO
+    # Uma tarefa por banco confere (e, se a planilha mudou, recompila) por vez; as outras esperam e reaproveitam
+    with warm.key_lock(('certibase-banco', os.path.abspath(store))):
+        store = tool.resolver_banco(database)
+        signature = _store_signature(tool, store)
+
+    def load():
+        # O banco sai do mmap e fica na memória do servidor
+        nomes, alelos, validos = tool.carregar_banco(store)
+        return nomes, np.array(alelos), validos
+
+    nomes, alelos, validos = warm.get(('certibase', store), signature, load)
+    indice = None
+    if params.get('prefilter'):
+        indice = warm.get(('certibase-indice', store), signature, lambda: tool.carregar_indice(store))
+    if 'rows' in params:
+        query_df = pd.DataFrame(params['rows'])
+    else:
+        query_df = tool.ler_planilha(params['queries'])
+    return tool.comparar_lote(query_df, nomes, alelos, validos, params.get('k', tool.RESULTADOS_POR_CONSULTA),
+                              params.get('min_similarity', 0.0), indice)
+
+
+def cacrest_job(tools, warm, params):
+    tool = tools['cacrest']
+    allometry = tool.load_allometry(params.get('models'))
+    if params.get('model'):
+        allometry['default'] = params['model']
+    if params.get('float_diameter'):
+        allometry['float_diameter'] = True
+
+    if 'circumference' in params:
+        df = pd.DataFrame({'CAP': params['circumference']})
+    else:
+        df = warm.get(('cacrest', params['file']), file_signature(params['file']),
+                      lambda: pd.read_excel(params['file']))
+    trees = tool.calculate_inventory(df.iloc[:, 0], tool.select_models(df, allometry), allometry)
+    output = tool.add_mean_row(trees)
+    if params.get('output'):
+        tool.write_styled_excel(output, params['output'])
+    if params.get('graph'):
+        labels, counts = tool.diameter_histogram(trees['Diâmetro'], params.get('bins', tool.DIAMETER_BINS))
+        tool.render_histogram(labels, counts, params['graph'])
+    return output
+
+
+def produtiv_job(tools, warm, params):
+    tool = tools['produtiv']
+    model = tool.load_farm_model(params.get('config'))
+    if 'productivity' in params:
+        model['productivity'] = params['productivity']
+    farms = list(model['productivity'])
+    input_file = params['input']
+
+    # A tabela de variações é a parte cara e não depende das produtividades: fica em memória
+    key = ('produtiv', input_file, tuple(farms), model['before_pattern'], model['after_pattern'])
+    variations_df = warm.get(key, file_signature(input_file), lambda: tool.calculate_species_variation(
+        tool.load_abundance_data(input_file, farms, model), verbose=False, farms=farms, model=model))
+
+    productivity_factors, _ = tool.calculate_productivity_factors(model['productivity'], verbose=False)
+    results_df = tool.calculate_productivity_weighted_score(variations_df, productivity_factors, verbose=False)
+    significance = params.get('significance')
+    if significance:
+        # As tarefas já rodam no conjunto de threads do servidor; além disso, o módulo carregado pelo caminho não
+        # pode ser serializado para outros processos, então as reamostragens ficam no processo do servidor
+        significance = dict(significance, processes=1)
+        results_df = results_df.join(tool.calculate_significance(variations_df, productivity_factors, **significance))
+    results_df = tool.interpret_results(results_df)
+    if params.get('output'):
+        tool.save_results(results_df, params['output'])
+    return results_df
+
+
+JOBS = {'certibase': certibase_job, 'cacrest': cacrest_job, 'produtiv': produtiv_job}
+
+
+def to_ndjson(df):
+    """Uma linha JSON por registro; números com precisão completa e NaN como null."""
+    records = df.astype(object).where(df.notna(), None).to_dict('records')
+    return ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records)
+
+
+class JobServer:
+    """
+    Fila de tarefas e servidor HTTP (asyncio). Os cálculos rodam em até `workers` threads, que
+    compartilham os dados em memória; acima de `max_pending` tarefas não concluídas, novas tarefas
+    são recusadas (503). São mantidas as últimas `max_jobs` tarefas; os resultados ficam disponíveis
+    por `result_ttl` segundos e, acima de `max_result_bytes` no total, os mais antigos são descartados
+    (a tarefa passa para 'expired').
+    """
+
+    def __init__(self, workers=2, max_pending=100, max_jobs=1000, warm_entries=8, result_ttl=3600,
+                 max_result_bytes=1 << 30):
+        self.tools = {name: load_tool(name) for name in JOBS}
+        self.warm = WarmCache(warm_entries)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending
+        self.max_jobs = max_jobs
+        self.result_ttl = result_ttl
+        self.max_result_bytes = max_result_bytes
+        self.jobs = OrderedDict()
+        self.ids = itertools.count(1)
+
+    # Tarefas
+
+    def pending(self):
+        return sum(job['status'] in ('queued', 'running') for job in self.jobs.values())
+
+    def submit(self, params):
+        tool = params.get('tool')
+        if tool not in JOBS:
+            raise ValueError(f"tool deve ser um de: {', '.join(JOBS)}")
+        if self.pending() >= self.max_pending:
+            raise OverflowError("Fila cheia, tente novamente mais tarde")
+        job = {'id': str(next(self.ids)), 'tool': tool, 'status': 'queued', 'submitted': time.time(),
+               'started': None, 'finished': None, 'error': None, 'rows': None,
+               'result': None, 'result_bytes': 0, 'done': asyncio.Event()}
+        self.jobs[job['id']] = job
+        while len(self.jobs) > self.max_jobs:
+            oldest = next(iter(self.jobs.values()))
+            if oldest['status'] in ('queued', 'running'):
+                break
+            self.jobs.popitem(last=False)
+        asyncio.get_running_loop().create_task(self._run(job, params))
+        return job
+
+    def _execute(self, job, params):
+        job['status'] = 'running'
+        job['started'] = time.time()
+        return JOBS[job['tool']](self.tools, self.warm, params)
+
+    async def _run(self, job, params):
+        loop = asyncio.get_running_loop()
+        try:
+            job['result'] = await loop.run_in_executor(self.executor, self._execute, job, params)
+            job['rows'] = len(job['result'])
+            job['result_bytes'] = int(job['result'].memory_usage(deep=True).sum())
+            job['status'] = 'done'
+        except Exception as error:
+            job['error'] = f"{type(error).__name__}: {error}"
+            job['status'] = 'error'
+        job['finished'] = time.time()
+        job['done'].set()
+        self.expire_results()
+        loop.call_later(self.result_ttl, self.expire_results)
+
+    def expire_results(self):
+        """Descarta os resultados vencidos e, acima do limite de memória, os mais antigos (o mais recente fica)."""
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job['result'] is not None),
+                          key=lambda job: job['finished'])
+        total = sum(job['result_bytes'] for job in finished)
+        for i, job in enumerate(finished):
+            if job['finished'] + self.result_ttl > now and (total <= self.max_result_bytes or i == len(finished) - 1):
+                continue
+            # Envios em andamento guardam a própria referência ao resultado e terminam normalmente
+            total -= job['result_bytes']
+            job['result'] = None
+            job['status'] = 'expired'
+
+    @staticmethod
+    def describe(job):
+        return {key: job[key] for key in ('id', 'tool', 'status', 'submitted', 'started', 'finished', 'error', 'rows')}
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, body = await self._read_request(reader)
+            await self._route(method, path, body, writer)
+        except (ValueError, json.JSONDecodeError) as error:
+            await self._send_json(writer, 400, {'error': str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) < 2:
+            raise ValueError("Requisição inválida")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY:
+            raise ValueError("Corpo da requisição grande demais")
+        body = await reader.readexactly(length) if length else b''
+        return request_line[0].upper(), request_line[1].split('?')[0].rstrip('/') or '/', body
+
+    async def _route(self, method, path, body, writer):
+        parts = path.strip('/').split('/')
+        if method == 'GET' and path == '/health':
+            await self._send_json(writer, 200, {'status': 'ok', 'pending': self.pending(), 'jobs': len(self.jobs),
+                                                'warm': self.warm.keys()})
+        elif method == 'GET' and path == '/jobs':
+            await self._send_json(writer, 200, [self.describe(job) for job in self.jobs.values()])
+        elif method == 'POST' and path in ('/jobs', '/run'):
+            params = json.loads(body or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError("O corpo da requisição deve ser um objeto JSON")
+            try:
+                job = self.submit(params)
+            except OverflowError as error:
+                await self._send_json(writer, 503, {'error': str(error)})
+                return
+            if path == '/jobs':
+                await self._send_json(writer, 202, self.describe(job))
+            else:
+                await self._send_results(writer, job)
+        elif method == 'GET' and len(parts) in (2, 3) and parts[0] == 'jobs' and parts[1] in self.jobs:
+            job = self.jobs[parts[1]]
+            if len(parts) == 2:
+                await self._send_json(writer, 200, self.describe(job))
+            elif parts[2] == 'results':
+                await self._send_results(writer, job)
+            else:
+                await self._send_json(writer, 404, {'error': "Não encontrado"})
+        else:
+            await self._send_json(writer, 404, {'error': "Não encontrado"})
+
+    async def _send_json(self, writer, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        writer.write(self._headers(status, 'application/json', f'Content-Length: {len(body)}') + body)
+        await writer.drain()
+
+    @staticmethod
+    def _headers(status, content_type, extra):
+        reasons = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 410: 'Gone', 500: 'Internal Server Error',
+                   503: 'Service Unavailable'}
+        return (f'HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: {content_type}; charset=utf-8\r\n'
+                f'{extra}\r\nConnection: close\r\n\r\n').encode()
+
+    async def _send_results(self, writer, job):
+        await job['done'].wait()
+        if job['status'] == 'error':
+            await self._send_json(writer, 500, self.describe(job))
+            return
+        result = job['result']
+        if result is None:
+            await self._send_json(writer, 410, self.describe(job))
+            return
+        # Primeira linha: descrição da tarefa e colunas; depois uma linha JSON por registro, em blocos
+        writer.write(self._headers(200, 'application/x-ndjson', 'Transfer-Encoding: chunked'))
+        header = dict(self.describe(job), columns=[str(column) for column in result.columns])
+        await self._send_chunk(writer, json.dumps(header, ensure_ascii=False) + '\n')
+        # A serialização roda fora do laço de eventos (no executor padrão, sem esperar pelos cálculos em
+        # andamento), para que resultados grandes não travem as outras conexões
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(result), ROWS_PER_CHUNK):
+            text = await loop.run_in_executor(None, to_ndjson, result.iloc[start:start + ROWS_PER_CHUNK])
+            await self._send_chunk(writer, text)
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    async def _send_chunk(writer, text):
+        data = text.encode()
+        writer.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+        await writer.drain()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        addresses = ', '.join(f'{sock.getsockname()[0]}:{sock.getsockname()[1]}' for sock in server.sockets)
+        print(f"Servidor LFDGV em {addresses}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local de tarefas para CertiBase, CaCrEst e Produtiv.")
+    parser.add_argument('--host', default='127.0.0.1', help="Endereço (padrão: %(default)s, apenas esta máquina)")
+    parser.add_argument('--port', type=int, default=8765, help="Porta (padrão: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Threads de cálculo (padrão: número de núcleos)")
+    parser.add_argument('--max-pending', type=int, default=100,
+                        help="Tarefas não concluídas aceitas antes de recusar novas (padrão: %(default)s)")
+    parser.add_argument('--warm-entries', type=int, default=8,
+                        help="Conjuntos de dados mantidos em memória (padrão: %(default)s)")
+    parser.add_argument('--result-ttl', type=float, default=3600,
+                        help="Segundos em que os resultados de uma tarefa concluída ficam disponíveis (padrão: %(default)s)")
+    parser.add_argument('--max-result-mb', type=int, default=1024,
+                        help="Memória máxima dos resultados guardados, em MB (padrão: %(default)s)")
+    args = parser.parse_args(argv)
+
+    server = JobServer(args.workers, args.max_pending, warm_entries=args.warm_entries, result_ttl=args.result_ttl,
+                       max_result_bytes=args.max_result_mb * 2**20)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
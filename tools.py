@@ -0,0 +1,22 @@
+"""
+Scripts de CertiBase, CaCrEst e Produtiv, importados pelo caminho (as pastas não são pacotes).
+Usado pelos benchmarks e pelo servidor de tarefas.
+"""
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PATHS = {
+    'certibase': os.path.join(ROOT, 'CertiBase', 'CertiBase', 'CertiBase.py'),
+    'cacrest': os.path.join(ROOT, 'CaCrEst', 'CaCrEst.py'),
+    'produtiv': os.path.join(ROOT, 'Produtiv', 'produtiv.py'),
+}
+
+
+def load_tool(name, prefix='lfdgv'):
+    """Importa o script de uma ferramenta como o módulo `<prefix>_<name>`."""
+    spec = importlib.util.spec_from_file_location(f'{prefix}_{name}', PATHS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module